@@ -0,0 +1,96 @@
+import argparse
+import json
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+import db
+import evaluator
+import metrics
+import smells
+from configuration import ProjectConfiguration
+from definitions import Repository, PullRequest, Review, pulls_commits_table, pulls_assignees_table
+
+# tables whose indexes and primary keys were added by the _add_indexes migration
+_tables = [PullRequest.__table__, Review.__table__, pulls_commits_table, pulls_assignees_table]
+_links = [pulls_commits_table, pulls_assignees_table]
+
+
+def _queries(session: Session, repo: Repository) -> Dict[str, Callable]:
+    considered = evaluator.get_considered_prs(repo, session)
+    return {
+        "considered PRs": lambda: considered.statement,
+        "smell flags": lambda: smells.flags_query(considered, repo, smells.evaluators()).statement,
+        "review buddies": lambda: considered.filter(smells.expression(smells.review_buddies, repo)).statement,
+        "ping-pong": lambda: considered.filter(smells.expression(smells.ping_pong, repo)).statement,
+        "metrics matrix": lambda: metrics.matrix_query(considered, metrics.evaluators()).statement
+    }
+
+
+def _seq_scans(plan: dict) -> int:
+    return int(plan["Node Type"] == "Seq Scan") + sum(_seq_scans(child) for child in plan.get("Plans", []))
+
+
+def _explain(connection, statement) -> Tuple[float, int]:
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    result = connection.exec_driver_sql(f"EXPLAIN (ANALYZE, FORMAT JSON) {compiled}", compiled.params).scalar()
+    plan = (json.loads(result) if isinstance(result, str) else result)[0]
+    return plan["Execution Time"], _seq_scans(plan["Plan"])
+
+
+def _drop_indexes(connection) -> None:
+    for table in _tables:
+        for index in table.indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    for table in _links:
+        name = inspect(connection).get_pk_constraint(table.name)["name"]
+        if name is not None:
+            connection.execute(text(f"ALTER TABLE {table.name} DROP CONSTRAINT {name}"))
+
+
+def _measure(statements: Dict[str, Callable], drop: bool, runs: int) -> Dict[str, Tuple[float, int]]:
+    measures = {}
+    with db.engine.connect() as connection:
+        # dropping the indexes inside a transaction that is rolled back keeps the database untouched
+        transaction = connection.begin()
+        if drop:
+            _drop_indexes(connection)
+        connection.execute(text("ANALYZE"))
+        for name, statement in statements.items():
+            samples = [_explain(connection, statement()) for _ in range(runs)]
+            measures[name] = (min(time for time, _ in samples), samples[0][1])
+        transaction.rollback()
+    return measures
+
+
+def benchmark(repos: List[str], runs: int) -> None:
+    if db.engine.dialect.name != "postgresql":
+        print("EXPLAIN benchmarks are only supported on PostgreSQL")
+        return
+    session = db.get_session()
+    for repo in repos:
+        repository = session.query(Repository).filter(Repository.full_name == repo).first()
+        if repository is None:
+            print(f"Repository {repo} does not exist in specified database")
+            continue
+        statements = _queries(session, repository)
+        before = _measure(statements, True, runs)
+        after = _measure(statements, False, runs)
+        print(repo)
+        print(f"{'query'.ljust(20)}\t{'before ms':>10}\t{'after ms':>10}\t{'seq scans':>10}")
+        for name in statements:
+            print(f"{name.ljust(20)}\t{before[name][0]:>10.2f}\t{after[name][0]:>10.2f}\t"
+                  f"{f'{before[name][1]} -> {after[name][1]}':>10}")
+    session.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compares query plans of the hot queries without and with indexes")
+    parser.add_argument("--repo", action="append",
+                        help="full name of a repository to benchmark, defaults to projects in config.properties")
+    parser.add_argument("--runs", type=int, default=3, help="executions per query, the fastest one is reported")
+    args = parser.parse_args()
+    config = ProjectConfiguration()
+    db.prepare(config.connstr)
+    benchmark(args.repo or config.projects, args.runs)
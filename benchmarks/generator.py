@@ -0,0 +1,147 @@
+import csv
+import hashlib
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from definitions import User, Repository, PullRequest, Review, AuthorAssociationEnum, ReviewStatusesEnum, \
+    pulls_commits_table, pulls_assignees_table
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+_bodies = ["", "Fixes #12", "Small cleanup", "See ticket KAFKA-1234\nAdds a config option", "#42 done",
+           "Refactors the reader\n\nNo functional change", None]
+_states = [ReviewStatusesEnum.COMMENTED, ReviewStatusesEnum.APPROVED, ReviewStatusesEnum.CHANGES_REQUESTED,
+           ReviewStatusesEnum.DISMISSED]
+_associations = [AuthorAssociationEnum.MEMBER, AuthorAssociationEnum.CONTRIBUTOR, AuthorAssociationEnum.COLLABORATOR,
+                 AuthorAssociationEnum.NONE]
+
+
+def write_csv(path: str, rows: Iterable[dict]) -> int:
+    written = 0
+    with open(path, "w", newline="") as file:
+        writer = None
+        for row in rows:
+            if writer is None:
+                writer = csv.DictWriter(file, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+            written += 1
+    return written
+
+
+def commit_sha(repository_id: int, number: int, index: int) -> str:
+    return hashlib.sha1(f"{repository_id}/{number}/{index}".encode()).hexdigest()
+
+
+class GeneratedPull:
+    def __init__(self, pull: dict, reviews: List[dict], shas: List[str], assignees: List[int]):
+        self.pull = pull
+        self.reviews = reviews
+        self.shas = shas
+        self.assignees = assignees
+
+
+class Generator:
+    def __init__(self, pulls: int, repositories: int = 4, seed: int = 0):
+        self.pulls = pulls
+        self.repositories = repositories
+        self.seed = seed
+        self.users = max(50, pulls // 200)
+
+    def repository(self, repository_id: int) -> dict:
+        return {"id": repository_id, "name": f"project{repository_id}", "full_name": f"bench/project{repository_id}",
+                "owner_id": 1}
+
+    def repository_pulls(self, repository_id: int) -> int:
+        return self.pulls // self.repositories + (1 if repository_id <= self.pulls % self.repositories else 0)
+
+    def pull(self, repository_id: int, number: int) -> GeneratedPull:
+        # every PR has its own generator, so the mock server and the database generate identical data
+        r = random.Random(f"{self.seed}/{repository_id}/{number}")
+        pull_id = repository_id * 10_000_000 + number
+        author = r.randint(1, self.users)
+        created = datetime(2015, 1, 1) + timedelta(minutes=r.randint(0, 60 * 24 * 365 * 7))
+        assignees = r.sample(range(1, self.users + 1), r.choice([0, 0, 0, 1, 2]))
+        pull = {
+            "id": pull_id,
+            "number": number,
+            "title": "" if r.random() < 0.02 else f"Change {number}",
+            "user_id": author,
+            "body": r.choice(_bodies),
+            "created_at": created,
+            "closed_at": created + timedelta(minutes=int(r.expovariate(1 / 3000))),
+            "assignee_id": assignees[0] if len(assignees) > 0 else None,
+            "repository_id": repository_id,
+            "author_association": r.choice(_associations),
+            "merged": r.random() < 0.85,
+            "additions": int(r.paretovariate(1.2) * 10) - 10,
+            "deletions": int(r.paretovariate(1.5) * 5) - 5
+        }
+        # some authors are mostly reviewed by the same person, which makes review buddies and ping-pong appear
+        buddy = (author * 7) % self.users + 1
+        buddy_share = 0.7 if author % 4 == 0 else 0.2
+        reviews = []
+        for index in range(min(int(r.expovariate(1 / 2.5)), 15)):
+            reviews.append({
+                "id": pull_id * 16 + index,
+                "pull_id": pull_id,
+                "user_id": buddy if r.random() < buddy_share else r.randint(1, self.users),
+                "body": "" if r.random() < 0.4 else "Looks good. " * r.randint(1, 20),
+                "state": r.choice(_states),
+                "author_association": r.choice(_associations),
+                "submitted_at": pull["created_at"] + timedelta(minutes=r.randint(0, 6000))
+            })
+        shas = [commit_sha(repository_id, number, index) for index in range(1 + min(int(r.expovariate(1 / 2)), 40))]
+        return GeneratedPull(pull, reviews, shas, assignees)
+
+    def generated_pulls(self, repository_id: int) -> Iterator[GeneratedPull]:
+        for number in range(1, self.repository_pulls(repository_id) + 1):
+            yield self.pull(repository_id, number)
+
+    def commit(self, sha: str, project: str) -> dict:
+        r = random.Random(sha)
+        return {
+            "commit_id": sha, "project": project, "buggy": r.random() < 0.25,
+            "la": int(r.paretovariate(1.3) * 5), "ld": int(r.paretovariate(1.5) * 3), "nf": r.randint(1, 20),
+            "nd": r.randint(1, 5), "ns": r.randint(1, 3), "ent": r.random() * 3, "ndev": r.random() * 30,
+            "age": r.random() * 200, "nuc": r.random() * 10, "aexp": r.randint(0, 3000), "arexp": r.random() * 500,
+            "asexp": r.random() * 1000
+        }
+
+    def commits(self, repository_ids: List[int]) -> Iterator[dict]:
+        for repository_id in repository_ids:
+            project = self.repository(repository_id)["full_name"]
+            for generated in self.generated_pulls(repository_id):
+                for sha in generated.shas:
+                    yield self.commit(sha, project)
+
+    def _rows(self, repository_ids: List[int], chunk: int) -> Iterator[Dict[str, List[dict]]]:
+        rows = {"pull": [], "review": [], "pulls_commits": [], "pulls_assignees": []}
+        for repository_id in repository_ids:
+            for generated in self.generated_pulls(repository_id):
+                pull_id = generated.pull["id"]
+                rows["pull"].append(generated.pull)
+                rows["review"].extend(generated.reviews)
+                rows["pulls_commits"].extend({"pull_id": pull_id, "commit_id": sha} for sha in generated.shas)
+                rows["pulls_assignees"].extend({"pull_id": pull_id, "assignee_id": user} for user in generated.assignees)
+                if len(rows["pull"]) >= chunk:
+                    yield rows
+                    rows = {name: [] for name in rows}
+        yield rows
+
+    def populate(self, connection, chunk: int = 10000) -> Tuple[int, int]:
+        connection.execute(User.__table__.insert(),
+                           [{"id": user, "login": f"user{user}"} for user in range(1, self.users + 1)])
+        connection.execute(Repository.__table__.insert(),
+                           [self.repository(repository_id) for repository_id in range(1, self.repositories + 1)])
+        tables = {"pull": PullRequest.__table__, "review": Review.__table__, "pulls_commits": pulls_commits_table,
+                  "pulls_assignees": pulls_assignees_table}
+        pulls, reviews = 0, 0
+        for rows in self._rows(list(range(1, self.repositories + 1)), chunk):
+            for name, table in tables.items():
+                if len(rows[name]) > 0:
+                    connection.execute(table.insert(), rows[name])
+            pulls += len(rows["pull"])
+            reviews += len(rows["review"])
+        return pulls, reviews
@@ -0,0 +1,216 @@
+import asyncio
+import re
+import threading
+import time
+from typing import Callable, Optional
+
+from aiohttp import web
+
+from benchmarks.generator import Generator, GeneratedPull
+
+
+def _timestamp(value) -> Optional[str]:
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ") if value is not None else None
+
+
+class GithubMock:
+    def __init__(self, generator: Generator, repository_id: int, limit: int = 5000, window: float = 3600,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.generator = generator
+        self.repository_id = repository_id
+        self.repository = generator.repository(repository_id)
+        self.limit = limit
+        self.window = window
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._used = {}
+        self._runner: Optional[web.AppRunner] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _user(self, user_id: Optional[int]) -> Optional[dict]:
+        return {"id": user_id, "login": f"user{user_id}"} if user_id is not None else None
+
+    def _repo(self) -> dict:
+        return {"id": self.repository["id"], "name": self.repository["name"], "full_name": self.repository["full_name"],
+                "owner": self._user(self.repository["owner_id"])}
+
+    def _pull(self, generated: GeneratedPull) -> dict:
+        pull = generated.pull
+        return {
+            "id": pull["id"],
+            "number": pull["number"],
+            "url": f"{self.url}/repos/{self.repository['full_name']}/pulls/{pull['number']}",
+            "title": pull["title"],
+            "user": self._user(pull["user_id"]),
+            "body": pull["body"],
+            "created_at": _timestamp(pull["created_at"]),
+            "closed_at": _timestamp(pull["closed_at"]),
+            "assignee": self._user(pull["assignee_id"]),
+            "assignees": [self._user(user) for user in generated.assignees],
+            "base": {"repo": self._repo()},
+            "author_association": pull["author_association"].name,
+            "merged": pull["merged"],
+            "additions": pull["additions"],
+            "deletions": pull["deletions"]
+        }
+
+    def _review(self, review: dict) -> dict:
+        return {
+            "id": review["id"],
+            "user": self._user(review["user_id"]),
+            "body": review["body"],
+            "state": review["state"].name,
+            "author_association": review["author_association"].name,
+            "submitted_at": _timestamp(review["submitted_at"])
+        }
+
+    def _page(self, request: web.Request, count: int, item: Callable[[int], dict]) -> web.Response:
+        # github style pagination with per_page and page query parameters and a Link header,
+        # only items of the requested page are generated
+        per_page = int(request.query.get("per_page", 30))
+        page = int(request.query.get("page", 1))
+        last = max(1, (count + per_page - 1) // per_page)
+        indexes = range((page - 1) * per_page, min(page * per_page, count))
+        response = web.json_response([item(index) for index in indexes])
+        links = []
+        if page < last:
+            links.append(f'<{request.url.update_query(page=page + 1)}>; rel="next"')
+        links.append(f'<{request.url.update_query(page=last)}>; rel="last"')
+        response.headers["Link"] = ", ".join(links)
+        return response
+
+    @web.middleware
+    async def _rate_limit(self, request: web.Request, handler) -> web.Response:
+        self.requests += 1
+        # like github, graphql queries have their own budget
+        resource = "graphql" if request.path == "/graphql" else "core"
+        key = (request.headers.get("Authorization", ""), resource)
+        now = time.time()
+        reset, used = self._used.get(key, (now + self.window, 0))
+        if reset <= now:
+            reset, used = now + self.window, 0
+        if used >= self.limit:
+            response = web.json_response({"message": "API rate limit exceeded"}, status=403)
+        else:
+            used += 1
+            response = await handler(request)
+        self._used[key] = (reset, used)
+        response.headers["x-ratelimit-limit"] = str(self.limit)
+        response.headers["x-ratelimit-remaining"] = str(self.limit - used)
+        response.headers["x-ratelimit-reset"] = str(int(reset))
+        response.headers["x-ratelimit-resource"] = resource
+        return response
+
+    def _generated(self, request: web.Request) -> GeneratedPull:
+        number = int(request.match_info["number"])
+        if not 1 <= number <= self.generator.repository_pulls(self.repository_id):
+            raise web.HTTPNotFound()
+        return self.generator.pull(self.repository_id, number)
+
+    async def _pulls(self, request: web.Request) -> web.Response:
+        return self._page(request, self.generator.repository_pulls(self.repository_id),
+                          lambda index: self._pull(self.generator.pull(self.repository_id, index + 1)))
+
+    async def _single_pull(self, request: web.Request) -> web.Response:
+        return web.json_response(self._pull(self._generated(request)))
+
+    async def _commits(self, request: web.Request) -> web.Response:
+        shas = self._generated(request).shas
+        return self._page(request, len(shas), lambda index: {"sha": shas[index]})
+
+    async def _reviews(self, request: web.Request) -> web.Response:
+        reviews = self._generated(request).reviews
+        return self._page(request, len(reviews), lambda index: self._review(reviews[index]))
+
+    def _author(self, user_id: Optional[int]) -> Optional[dict]:
+        return {"databaseId": user_id, "login": f"user{user_id}"} if user_id is not None else None
+
+    def _connection(self, nodes: list, first: int) -> dict:
+        return {"pageInfo": {"hasNextPage": len(nodes) > first}, "nodes": nodes[:first]}
+
+    async def _graphql(self, request: web.Request) -> web.Response:
+        # answers the PR query of the downloader, errors are reported like github does, with status 200
+        payload = await request.json()
+        firsts = {name: int(first) for name, first in re.findall(r"(\w+)\(first: *(\d+)\)", payload["query"])}
+        excessive = [name for name, first in firsts.items() if first > 100]
+        if len(excessive) > 0:
+            return web.json_response({"errors": [{
+                "type": "EXCESSIVE_PAGINATION",
+                "message": f"Requesting more than 100 records on the `{excessive[0]}` connection is not supported."
+            }]})
+        number = payload["variables"]["number"]
+        if not 1 <= number <= self.generator.repository_pulls(self.repository_id):
+            return web.json_response({"data": {"repository": {"pullRequest": None}},
+                                      "errors": [{"type": "NOT_FOUND", "message": f"Could not resolve PR {number}"}]})
+        generated = self.generator.pull(self.repository_id, number)
+        pull = generated.pull
+        reviews = [{
+            "databaseId": review["id"],
+            "author": self._author(review["user_id"]),
+            "body": review["body"],
+            "state": review["state"].name,
+            "authorAssociation": review["author_association"].name,
+            "submittedAt": _timestamp(review["submitted_at"])
+        } for review in generated.reviews]
+        return web.json_response({"data": {"repository": {"pullRequest": {
+            "databaseId": pull["id"],
+            "number": pull["number"],
+            "title": pull["title"],
+            "body": pull["body"],
+            "createdAt": _timestamp(pull["created_at"]),
+            "closedAt": _timestamp(pull["closed_at"]),
+            "updatedAt": _timestamp(pull["closed_at"] or pull["created_at"]),
+            "merged": pull["merged"],
+            "additions": pull["additions"],
+            "deletions": pull["deletions"],
+            "authorAssociation": pull["author_association"].name,
+            "author": self._author(pull["user_id"]),
+            "assignees": self._connection([self._author(user) for user in generated.assignees],
+                                          firsts.get("assignees", 100)),
+            "baseRepository": {"databaseId": self.repository["id"]},
+            "commits": self._connection([{"commit": {"oid": sha}} for sha in generated.shas],
+                                        firsts.get("commits", 100)),
+            "reviews": self._connection(reviews, firsts.get("reviews", 100))
+        }}}})
+
+    def _application(self) -> web.Application:
+        application = web.Application(middlewares=[self._rate_limit])
+        prefix = f"/repos/{self.repository['full_name']}/pulls"
+        application.add_routes([web.get(prefix, self._pulls),
+                                web.get(prefix + "/{number}", self._single_pull),
+                                web.get(prefix + "/{number}/commits", self._commits),
+                                web.get(prefix + "/{number}/reviews", self._reviews),
+                                web.post("/graphql", self._graphql)])
+        return application
+
+    async def _start(self) -> None:
+        self._runner = web.AppRunner(self._application(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+
+    def start(self) -> None:
+        # the server runs in its own thread, so the downloader can use asyncio.run in the calling one
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def _serve() -> None:
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=_serve, daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
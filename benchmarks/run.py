@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import create_engine, select, func
+
+import csv_importer
+import db
+import downloader
+import evaluator
+import metrics
+import review_stats
+import smells
+import text_features
+from benchmarks.generator import SCALES, Generator, write_csv
+from benchmarks.github_mock import GithubMock
+from definitions import Base, PullRequest
+from token_pool import TokenPool
+
+
+def _timed(function: Callable) -> Tuple[object, float]:
+    started = time.perf_counter()
+    value = function()
+    return value, time.perf_counter() - started
+
+
+def _record(results: List[dict], name: str, seconds: float, **values) -> None:
+    results.append({"name": name, "seconds": round(seconds, 4), **values})
+    print(f"{name.ljust(50)}\t{seconds:>10.3f}s")
+
+
+def _prepare_database(connection_string: str, reset: bool) -> bool:
+    if reset:
+        Base.metadata.drop_all(create_engine(connection_string))
+    db.prepare(connection_string)
+    with db.engine.connect() as connection:
+        if connection.execute(select(func.count()).select_from(PullRequest)).scalar() > 0:
+            print("Benchmarks need an empty database, run them with --reset to drop all tables first")
+            return False
+    return True
+
+
+def _download(results: List[dict], generator: Generator, repository_id: int, concurrency: int) -> None:
+    mock = GithubMock(generator, repository_id)
+    mock.start()
+    try:
+        downloader.api_url = mock.url
+        downloader.token_pool = TokenPool(["benchmark"], announce=downloader.status.message)
+        project = generator.repository(repository_id)["full_name"]
+        _, seconds = _timed(lambda: asyncio.run(downloader.download_project_pulls(project, concurrency)))
+    finally:
+        mock.stop()
+    _record(results, "download", seconds, pulls=generator.pulls, requests=mock.requests,
+            pulls_per_second=round(generator.pulls / seconds, 1), requests_per_second=round(mock.requests / seconds, 1))
+
+
+def _evaluate(results: List[dict], repos: List[str]) -> None:
+    session = db.get_session()
+    for smell in smells.evaluators():
+        _, seconds = _timed(lambda: [evaluator.evaluate(repo, smell, cached=False).smelly_count for repo in repos])
+        _record(results, f"smell.{smell.__name__}", seconds)
+    for metric in metrics.evaluators():
+        _, seconds = _timed(lambda: [evaluator.evaluate(repo, metric, cached=False).to_list(session) for repo in repos])
+        _record(results, f"metric.{metric.__name__}", seconds)
+    session.close()
+    _, seconds = _timed(lambda: [evaluator.evaluate_smells(repo, smells.evaluators()) for repo in repos])
+    _record(results, "smells.evaluate_all", seconds)
+    matrix, seconds = _timed(lambda: evaluator.build_matrix(repos, metrics.evaluators()))
+    _record(results, "metrics.build_matrix", seconds, rows=len(matrix))
+
+
+def benchmark(connection_string: str, scale: str, seed: int, download_pulls: int, concurrency: int,
+              output: str, reset: bool = False) -> None:
+    started_at = datetime.now().isoformat(timespec="seconds")
+    if not _prepare_database(connection_string, reset):
+        return
+    generator = Generator(SCALES[scale], seed=seed)
+    repository_ids = list(range(1, generator.repositories + 1))
+    # PRs served by the github mock belong to a repository which is not generated into the database
+    download_generator = Generator(download_pulls, repositories=1, seed=seed)
+    download_repository = generator.repositories + 1
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "apachejit.csv")
+        rows = write_csv(csv_path, itertools.chain(generator.commits(repository_ids),
+                                                   download_generator.commits([download_repository])))
+        _, seconds = _timed(lambda: csv_importer.bulk_import(csv_path))
+        _record(results, "csv_import", seconds, rows=rows, rows_per_second=round(rows / seconds, 1))
+    with db.engine.begin() as connection:
+        (pulls, reviews), seconds = _timed(lambda: generator.populate(connection))
+    _record(results, "generate", seconds, pulls=pulls, reviews=reviews)
+    with db.engine.begin() as connection:
+        _, seconds = _timed(lambda: review_stats.refresh(connection))
+    _record(results, "review_stats.refresh", seconds)
+    with db.engine.begin() as connection:
+        _, seconds = _timed(lambda: review_stats.refresh_pairs(connection))
+    _record(results, "review_stats.refresh_pairs", seconds)
+    with db.engine.begin() as connection:
+        filled, seconds = _timed(lambda: text_features.backfill(connection))
+    _record(results, "text_features.backfill", seconds, pulls=filled)
+    _download(results, download_generator, download_repository, concurrency)
+    _evaluate(results, [generator.repository(repository_id)["full_name"] for repository_id in repository_ids])
+    report = {
+        "scale": scale,
+        "pulls": generator.pulls,
+        "seed": seed,
+        "database": f"{db.engine.dialect.name} {'.'.join(map(str, db.engine.dialect.server_version_info or ()))}",
+        "python": platform.python_version(),
+        "started_at": started_at,
+        "results": results
+    }
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generates a synthetic dataset, serves it through a github mock "
+                                                 "and times import, download and evaluation")
+    parser.add_argument("--connstr", required=True,
+                        help="database used for benchmarks, its data is replaced by the generated one")
+    parser.add_argument("--scale", choices=list(SCALES), default="10k", help="number of generated PRs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--download-pulls", type=int, default=1000, help="number of PRs served by the github mock")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--reset", action="store_true", help="drop all tables of the database first")
+    args = parser.parse_args()
+    benchmark(args.connstr, args.scale, args.seed, args.download_pulls, args.concurrency, args.output, args.reset)
@@ -0,0 +1,119 @@
+import hashlib
+import importlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select, update
+
+import db
+from definitions import DataVersion
+
+Arrays = Dict[str, np.ndarray]
+
+directory = ".cache"
+max_entries = 256
+_memory: "OrderedDict[str, Arrays]" = OrderedDict()
+_sources: Dict[Callable, str] = {}
+# modules whose code changes results of evaluators besides the evaluator's own module: table definitions,
+# sql functions, selection of considered PRs and precomputed tables read by smells and metrics
+dependencies = ["definitions", "functions", "evaluator", "review_stats", "text_features"]
+_lock = threading.RLock()
+
+
+def prepare(cache_directory: str = ".cache", cache_entries: int = 256) -> None:
+    global directory, max_entries
+    directory = cache_directory
+    max_entries = cache_entries
+    _memory.clear()
+
+
+def bump(connection, repository_ids: Iterable[int]) -> None:
+    repository_ids = list(set(repository_ids))
+    if len(repository_ids) == 0:
+        return
+    connection.execute(db.insert_on_conflict(DataVersion.__table__, ["repository_id"]),
+                       [{"repository_id": repository_id, "version": 0} for repository_id in repository_ids])
+    connection.execute(update(DataVersion)
+                       .where(DataVersion.repository_id.in_(repository_ids))
+                       .values(version=DataVersion.version + 1, updated_at=datetime.now()))
+
+
+def version(session, repository_id: int) -> int:
+    return session.execute(
+        select(DataVersion.version).where(DataVersion.repository_id == repository_id)).scalar() or 0
+
+
+def _name(value) -> str:
+    if callable(value):
+        return f"{value.__module__}.{value.__qualname__}"
+    if isinstance(value, (list, tuple)):
+        return f"[{','.join(map(_name, value))}]"
+    return repr(value)
+
+
+def source_hash(evaluator: Callable) -> str:
+    # results of an older implementation of the evaluator or of its dependencies must not be served
+    if evaluator not in _sources:
+        digest = hashlib.sha1()
+        for module in sorted({evaluator.__module__, *dependencies}):
+            with open(importlib.import_module(module).__file__, "rb") as file:
+                digest.update(file.read())
+        _sources[evaluator] = digest.hexdigest()[:12]
+    return _sources[evaluator]
+
+
+def _key(repository_id: int, evaluator: Callable, args: Tuple, settings: Tuple) -> str:
+    return hashlib.sha1(f"{repository_id}|{_name(evaluator)}|{_name(args)}|{_name(settings)}".encode()).hexdigest()
+
+
+def _remember(path: str, arrays: Arrays) -> None:
+    with _lock:
+        _memory[path] = arrays
+        _memory.move_to_end(path)
+        while len(_memory) > max_entries:
+            _memory.popitem(last=False)
+
+
+def _load(path: str) -> Optional[Arrays]:
+    with _lock:
+        if path in _memory:
+            _memory.move_to_end(path)
+            return _memory[path]
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as stored:
+        arrays = {name: stored[name] for name in stored.files}
+    _remember(path, arrays)
+    return arrays
+
+
+def _store(key: str, path: str, arrays: Arrays) -> None:
+    # evaluations may run in parallel threads, see evaluator.evaluate_many
+    with _lock:
+        os.makedirs(directory, exist_ok=True)
+        # entries of older data versions are never read again
+        for name in os.listdir(directory):
+            if name.startswith(key) and os.path.join(directory, name) != path:
+                os.remove(os.path.join(directory, name))
+                _memory.pop(os.path.join(directory, name), None)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(temporary, path)
+        _remember(path, arrays)
+
+
+def materialize(session, repository_id: int, evaluator: Callable, args: Tuple, result, settings: Tuple = ()):
+    # settings are values changing results besides the arguments, e.g. smells.thresholds
+    key = _key(repository_id, evaluator, args, settings)
+    path = os.path.join(directory, f"{key}-{version(session, repository_id)}-{source_hash(evaluator)}.npz")
+    arrays = _load(path)
+    if arrays is None:
+        arrays = result.materialize()
+        _store(key, path, arrays)
+    result.load(arrays)
+    return result
@@ -9,3 +9,10 @@ class ProjectConfiguration:
         self.connstr = self.config.get("Config", "connstr")
         self.gh_keys = self.config.get("Config", "gh_keys").split(",")
         self.csv_path = self.config.get("Config", "csv_path")
+        self.concurrency = self.config.getint("Config", "concurrency", fallback=20)
+        self.api_url = self.config.get("Config", "api_url", fallback="https://api.github.com")
+        self.max_attempts = self.config.getint("Config", "max_attempts", fallback=5)
+        self.buddy_share = self.config.getfloat("Config", "buddy_share", fallback=0.5)
+        self.buddy_min_reviews = self.config.getint("Config", "buddy_min_reviews", fallback=50)
+        self.ping_pong_rounds = self.config.getint("Config", "ping_pong_rounds", fallback=3)
+        self.pending_writes = self.config.getint("Config", "pending_writes", fallback=2)
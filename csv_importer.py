@@ -1,8 +1,31 @@
+import argparse
+import io
+import threading
+import time
+from queue import Queue
+from typing import Iterator, List, Optional
+
+import numpy as np
 import pandas as pd
+from sqlalchemy import Table, MetaData, Column, Integer, select, func
 
+import cache
 import db
 from configuration import ProjectConfiguration
-from definitions import Commit
+from definitions import Commit, Repository
+
+_columns = [column.name for column in Commit.__table__.columns]
+_dtypes = {column.name: column.type.python_type for column in Commit.__table__.columns}
+# columns of ApacheJIT which are imported, others like author_date are never parsed
+_csv_dtypes = {"commit_id": str, "project": "category", "buggy": bool,
+               "la": np.int32, "ld": np.int32, "nf": np.int32, "nd": np.int32, "ns": np.int32, "aexp": np.int32,
+               "ent": np.float64, "ndev": np.float64, "age": np.float64, "nuc": np.float64, "arexp": np.float64,
+               "asexp": np.float64}
+
+
+def _invalidate(connection, projects) -> None:
+    repository_ids = connection.execute(select(Repository.id).where(Repository.full_name.in_(projects))).scalars()
+    cache.bump(connection, repository_ids)
 
 
 def import_values(df):
@@ -27,10 +50,98 @@ def import_values(df):
         session.merge(commit)
         session.commit()
     session.close()
+    with db.engine.begin() as connection:
+        _invalidate(connection, df["project"].astype(str).unique().tolist())
+
+
+def _staging_table() -> Table:
+    # seq keeps the file order, so the last occurrence of a duplicated commit wins like in import_values
+    return Table("commit_staging", MetaData(),
+                 Column("seq", Integer, primary_key=True, autoincrement=True),
+                 *[Column(column.name, column.type) for column in Commit.__table__.columns],
+                 prefixes=["TEMPORARY"])
+
+
+def _read_chunks(csv_path: str, projects: Optional[List[str]], chunksize: int) -> Iterator[pd.DataFrame]:
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize, usecols=list(_csv_dtypes), dtype=_csv_dtypes):
+        if projects:
+            chunk = chunk[chunk["project"].isin(projects)]
+        if not chunk.empty:
+            yield chunk
+
+
+def _prefetch(chunks: Iterator[pd.DataFrame], depth: int = 2) -> Iterator[pd.DataFrame]:
+    # the next chunks are parsed in a thread while the current one is written, at most depth chunks wait in memory
+    queue = Queue(maxsize=depth)
+    finished = object()
+
+    def _read() -> None:
+        try:
+            for chunk in chunks:
+                queue.put(chunk)
+        except Exception as e:
+            queue.put(e)
+        queue.put(finished)
+
+    threading.Thread(target=_read, daemon=True).start()
+    while True:
+        chunk = queue.get()
+        if chunk is finished:
+            return
+        if isinstance(chunk, Exception):
+            raise chunk
+        yield chunk
+
+
+def _prepare_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    return chunk.rename(columns={"commit_id": "id"})[_columns].astype(_dtypes)
+
+
+def _stage_chunk(connection, staging: Table, chunk: pd.DataFrame) -> None:
+    if connection.dialect.name == "postgresql":
+        buffer = io.StringIO()
+        chunk.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(f"COPY {staging.name} ({', '.join(_columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.close()
+    else:
+        connection.execute(staging.insert(), chunk.to_dict("records"))
+
+
+def bulk_import(csv_path: str, projects: Optional[List[str]] = None, chunksize: int = 50000) -> int:
+    started = time.time()
+    staged = 0
+    staging = _staging_table()
+    with db.engine.begin() as connection:
+        staging.create(connection)
+        for chunk in _prefetch(map(_prepare_chunk, _read_chunks(csv_path, projects, chunksize))):
+            _stage_chunk(connection, staging, chunk)
+            staged += len(chunk)
+            print(f"Staged {staged} rows ({staged / (time.time() - started):.0f} rows/s)")
+        latest = select(func.max(staging.c.seq)).group_by(staging.c.id)
+        rows = select(*[staging.c[name] for name in _columns]).where(staging.c.seq.in_(latest))
+        connection.execute(db.insert_on_conflict(Commit.__table__, ["id"], _columns[1:], select=rows))
+        _invalidate(connection, select(staging.c.project).distinct())
+        staging.drop(connection)
+    elapsed = time.time() - started
+    print(f"Imported {staged} rows in {elapsed:.1f}s ({staged / elapsed:.0f} rows/s)")
+    return staged
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Imports ApacheJIT commits into the database")
+    parser.add_argument("--bulk", action="store_true",
+                        help="stream the csv in chunks and upsert it with a single statement")
+    parser.add_argument("--project", action="store_true",
+                        help="import only projects listed in config.properties")
+    args = parser.parse_args()
     config = ProjectConfiguration()
     db.prepare(config.connstr)
-    csv_file = pd.read_csv(config.csv_path)
-    import_values(csv_file)
+    selected_projects = config.projects if args.project else None
+    if args.bulk:
+        bulk_import(config.csv_path, selected_projects)
+    else:
+        # the file is read in chunks, memory does not grow with its size
+        for csv_chunk in _prefetch(_read_chunks(config.csv_path, selected_projects, 50000)):
+            import_values(csv_chunk)
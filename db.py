@@ -1,17 +1,61 @@
-from sqlalchemy import create_engine
+from typing import Iterable, Optional
+
+from sqlalchemy import create_engine, Table, inspect, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 
 import definitions
+import migrations
 
 Session = sessionmaker()
+engine = None
+
+
+def _sqlite_pragmas(connection, _) -> None:
+    # readers are not blocked by the downloader writing into the same file
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
 
+def _create_engine(connection_string: str, pool_size: int, max_overflow: int):
+    if make_url(connection_string).get_backend_name() == "sqlite":
+        # embedded database file, e.g. a snapshot made by snapshot.py, connections are opened per use
+        sqlite_engine = create_engine(connection_string)
+        event.listen(sqlite_engine, "connect", _sqlite_pragmas)
+        return sqlite_engine
+    # one engine per process, pool is sized for its threads, e.g. evaluate_many workers or the downloader writer
+    return create_engine(connection_string, pool_size=pool_size, max_overflow=max_overflow)
 
-def prepare(connection_string):
-    engine = create_engine(connection_string, pool_size=50, max_overflow=50)
+
+def prepare(connection_string, pool_size: int = 10, max_overflow: int = 5):
+    global engine
+    engine = _create_engine(connection_string, pool_size, max_overflow)
+    fresh = not inspect(engine).has_table(definitions.PullRequest.__tablename__)
     definitions.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        migrations.upgrade(connection, fresh)
     global Session
     Session = sessionmaker(bind=engine)
 
 
 def get_session():
     return Session()
+
+
+def insert_on_conflict(table: Table, index_elements: Iterable[str], update_columns: Optional[Iterable[str]] = None,
+                       select=None):
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported for {engine.dialect.name}")
+    statement = insert(table)
+    if select is not None:
+        statement = statement.from_select(list(select.selected_columns.keys()), select)
+    if update_columns:
+        return statement.on_conflict_do_update(index_elements=list(index_elements),
+                                               set_={c: statement.excluded[c] for c in update_columns})
+    return statement.on_conflict_do_nothing(index_elements=list(index_elements))
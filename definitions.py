@@ -1,6 +1,7 @@
 import enum
+from datetime import datetime
 
-from sqlalchemy import ForeignKey, Column, Integer, String, Float, Boolean, Enum, DateTime, Table
+from sqlalchemy import ForeignKey, Column, Integer, String, Float, Boolean, Enum, DateTime, Table, Index, and_, or_
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -44,8 +45,9 @@ class Commit(Base):
 
 
 pulls_commits_table = Table('pulls_commits', Base.metadata,
-                            Column('commit_id', ForeignKey('commit.id')),
-                            Column('pull_id', ForeignKey('pull.id'))
+                            Column('commit_id', ForeignKey('commit.id'), primary_key=True),
+                            Column('pull_id', ForeignKey('pull.id'), primary_key=True),
+                            Index('ix_pulls_commits_pull_id', 'pull_id')
                             )
 
 
@@ -61,6 +63,11 @@ class Review(Base):
     author_association = Column(Enum(AuthorAssociationEnum))
     submitted_at = Column(DateTime)
 
+    __table_args__ = (
+        Index('ix_review_pull_id_user_id', 'pull_id', 'user_id'),
+        Index('ix_review_user_id_pull_id', 'user_id', 'pull_id'),
+    )
+
     def __str__(self) -> str:
         return str(vars(self))
 
@@ -76,8 +83,9 @@ class User(Base):
 
 
 pulls_assignees_table = Table('pulls_assignees', Base.metadata,
-                              Column('assignee_id', ForeignKey('user.id')),
-                              Column('pull_id', ForeignKey('pull.id'))
+                              Column('assignee_id', ForeignKey('user.id'), primary_key=True),
+                              Column('pull_id', ForeignKey('pull.id'), primary_key=True),
+                              Index('ix_pulls_assignees_pull_id', 'pull_id')
                               )
 
 
@@ -102,11 +110,23 @@ class PullRequest(Base):
     reviews = relationship('Review')
     additions = Column(Integer)
     deletions = Column(Integer)
+    # set whenever the downloader stores the PR, incremental evaluations recompute PRs changed since their watermark
+    updated_at = Column(DateTime, default=datetime.now)
 
     def __str__(self) -> str:
         return str(vars(self))
 
 
+Index('ix_pull_repository_id_user_id', PullRequest.repository_id, PullRequest.user_id)
+Index('ix_pull_user_id', PullRequest.user_id)
+Index('ix_pull_assignee_id', PullRequest.assignee_id)
+Index('ix_pull_repository_id_updated_at', PullRequest.repository_id, PullRequest.updated_at)
+# predicate of evaluator.get_considered_prs
+_considered = and_(PullRequest.merged, or_(PullRequest.additions > 0, PullRequest.deletions > 0))
+Index('ix_pull_considered', PullRequest.repository_id, PullRequest.id,
+      postgresql_where=_considered, sqlite_where=_considered)
+
+
 # noinspection SpellCheckingInspection
 class Repository(Base):
     __tablename__ = 'repo'
@@ -119,3 +139,120 @@ class Repository(Base):
 
     def __str__(self) -> str:
         return str(vars(self))
+
+
+class CrawlState(Base):
+    __tablename__ = 'crawl_state'
+    url = Column(String, primary_key=True)
+    project = Column(String, index=True)
+    etag = Column(String)
+    last_modified = Column(String)
+    completed_at = Column(DateTime)
+
+    def __str__(self) -> str:
+        return str(vars(self))
+
+
+class DeadLetter(Base):
+    __tablename__ = 'dead_letter'
+    url = Column(String, primary_key=True)
+    project = Column(String, index=True)
+    attempts = Column(Integer)
+    status = Column(Integer)
+    error = Column(String)
+    failed_at = Column(DateTime)
+
+    def __str__(self) -> str:
+        return str(vars(self))
+
+
+class PullReviewStats(Base):
+    __tablename__ = 'pull_review_stats'
+    pull_id = Column(Integer, ForeignKey('pull.id'), primary_key=True)
+    review_count = Column(Integer)
+    reviewer_count = Column(Integer)
+    other_reviewer_count = Column(Integer)
+    body_chars = Column(Integer)
+    max_reviews_per_reviewer = Column(Integer)
+    first_review_at = Column(DateTime)
+    last_review_at = Column(DateTime)
+
+    def __str__(self) -> str:
+        return str(vars(self))
+
+
+class ReviewerPair(Base):
+    # reviews received by a PR author from other reviewers within a repository
+    __tablename__ = 'reviewer_pair'
+    repository_id = Column(Integer, ForeignKey('repo.id'), primary_key=True)
+    requester_id = Column(Integer, ForeignKey('user.id'), primary_key=True)
+    reviewer_id = Column(Integer, ForeignKey('user.id'), primary_key=True)
+    reviews = Column(Integer)
+    requester_reviews = Column(Integer)
+
+    def __str__(self) -> str:
+        return str(vars(self))
+
+
+class PullTextFeatures(Base):
+    __tablename__ = 'pull_text_features'
+    pull_id = Column(Integer, ForeignKey('pull.id'), primary_key=True)
+    body_length = Column(Integer)
+    line_count = Column(Integer)
+    # bit mask of patterns matched in the body, see text_features._patterns
+    patterns = Column(Integer)
+    version = Column(Integer)
+
+    def __str__(self) -> str:
+        return str(vars(self))
+
+
+class PullSmell(Base):
+    __tablename__ = 'pull_smell'
+    pull_id = Column(Integer, ForeignKey('pull.id'), primary_key=True)
+    smell = Column(String, primary_key=True)
+    smelly = Column(Boolean)
+
+    def __str__(self) -> str:
+        return str(vars(self))
+
+
+class PullMetric(Base):
+    __tablename__ = 'pull_metric'
+    pull_id = Column(Integer, ForeignKey('pull.id'), primary_key=True)
+    metric = Column(String, primary_key=True)
+    value = Column(Float)
+
+    def __str__(self) -> str:
+        return str(vars(self))
+
+
+class EvaluationWatermark(Base):
+    __tablename__ = 'evaluation_watermark'
+    repository_id = Column(Integer, ForeignKey('repo.id'), primary_key=True)
+    evaluator = Column(String, primary_key=True)
+    # thresholds and implementation the stored results were computed with
+    settings = Column(String)
+    evaluated_at = Column(DateTime)
+
+    def __str__(self) -> str:
+        return str(vars(self))
+
+
+class SchemaVersion(Base):
+    __tablename__ = 'schema_version'
+    version = Column(Integer, primary_key=True)
+    applied_at = Column(DateTime)
+
+    def __str__(self) -> str:
+        return str(vars(self))
+
+
+class DataVersion(Base):
+    __tablename__ = 'data_version'
+    repository_id = Column(Integer, ForeignKey('repo.id'), primary_key=True)
+    version = Column(Integer)
+    updated_at = Column(DateTime)
+
+    def __str__(self) -> str:
+        return str(vars(self))
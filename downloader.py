@@ -1,231 +1,457 @@
+import argparse
 import asyncio
-import json
-import os
-import random
-import re
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
+from email.utils import format_datetime
+from typing import Dict, List, Optional, Set, Tuple
 
 import aiohttp
-import requests
 
 import db
 from configuration import ProjectConfiguration
-from definitions import User, PullRequest, Repository, AuthorAssociationEnum, Review, ReviewStatusesEnum, Commit
-
-
-def cls() -> None:
-    os.system('cls' if os.name == 'nt' else 'clear')
-
-
-def _count_subpages(url: str) -> int:
-    github_token = random.choice(github_tokens)
-    pattern = re.compile('([0-9]+)>; rel="last"')
-    request = requests.get(url, headers={"Authorization": f"token {github_token}"})
-    if request.status_code != 200:
-        print(f"Failed to fetch the number of pages for {url}")
-        print(request.text)
-        return 0
-    try:
-        repo = json.loads(request.text)[0]["base"]["repo"]
-        session = db.get_session()
-        session.merge(User(
-            id=repo["owner"]["id"],
-            login=repo["owner"]["login"]
-        ))
-        session.merge(Repository(
-            id=repo["id"],
-            name=repo["name"],
-            full_name=repo["full_name"],
-            owner_id=repo["owner"]["id"]
-        ))
-        session.commit()
-        session.close()
-    except:
-        pass
-    # przemilczmy jakość kodu w tym miejscu
-    return int(pattern.search(request.headers["Link"]).group(1)) if "Link" in request.headers else 1
-
-
-def _print_status(general: str, overall: float, started: datetime) -> None:
-    cls()
-    print(general)
-    print(f"Done in: 0%{' ' * 94}100%")
-    line4 = f"General: {'#' * int(overall * 100)}".ljust(110, " ")
-    print(line4 + "{:.2f}".format(overall * 100) + "%")
-    if overall > 0:
-        delta = (datetime.now() - started).seconds
-        remaining_time = delta / overall - delta
-        print(f"\nRemaining time: {int(remaining_time // 60)}m{int(remaining_time % 60)}s")
-
-
-async def _fetch_pr(session: aiohttp.ClientSession, link: str):
-    github_token = random.choice(github_tokens)
-
-    async def _get_results(url):
-        request = await session.request('GET',
-                                        url=url,
-                                        headers={"Authorization": f"token {github_token}"})
-        if request.status == 403:
-            waiting = int(request.headers["x-ratelimit-reset"]) - int(time.time()) + 60
-            print(f"\n[{datetime.now()}] Exceeded number of requests, waiting {waiting // 60}m{waiting % 60}s",
-                  end="")
-            time.sleep(waiting)
-            return await _fetch_pr(session, link)
-        elif request.status >= 400:
-            print(f"\n[{datetime.now()}] Something went wrong\n"
-                  f"\tstatus:\t{request.status}/{request.status}/{request.status}\n"
-                  f"\taddress:\t{link}\n"
-                  f"\tnext request in 1 minute", end="")
-            return await _fetch_pr(session, link)
-        else:
-            return await request.json(), request
+from definitions import Commit, CrawlState, DeadLetter
+from persistence import Batch, WriteBehindBuffer, Writer
+from retry_policy import RetryPolicy, RetryError
+from telemetry import Telemetry, JsonLinesSink, PrometheusSink, StatusLine, Throughput
+from token_pool import TokenPool
+
+api_url = "https://api.github.com"
+retry_policy = RetryPolicy()
+telemetry = Telemetry()
+status = StatusLine()
+
+
+def _load_crawl_state(project: str) -> Dict[str, CrawlState]:
+    session = db.get_session()
+    states = {state.url: state for state in session.query(CrawlState).filter(CrawlState.project == project)}
+    session.close()
+    return states
+
+
+def _validators(request) -> Tuple[Optional[str], Optional[str]]:
+    return request.headers.get("ETag"), request.headers.get("Last-Modified")
+
+
+def _load_commit_shas(project: str) -> Set[str]:
+    session = db.get_session()
+    shas = {sha for sha, in session.query(Commit.id).filter(Commit.project == project)}
+    session.close()
+    return shas
+
+
+def _load_dead_letters(project: str) -> List[str]:
+    session = db.get_session()
+    urls = [url for url, in session.query(DeadLetter.url).filter(DeadLetter.project == project)]
+    session.close()
+    return urls
+
+
+def _report_error(address: str, error: Exception) -> None:
+    telemetry.event("error", address=address, error=repr(error))
+    status.message(f"[{datetime.now()}] Something went wrong\taddress: {address}\t{repr(error)}")
+
+
+def _record_tokens(resource: str) -> None:
+    for token, remaining in token_pool.remaining(resource).items():
+        telemetry.gauge("token_remaining", remaining, token=f"...{token[-4:]}", resource=resource)
+
+
+async def _get_results(session: aiohttp.ClientSession, url: str, state: Optional[CrawlState] = None,
+                       query: Optional[dict] = None):
+    headers = {}
+    if state is not None and state.etag is not None:
+        headers["If-None-Match"] = state.etag
+    if state is not None and state.last_modified is not None:
+        headers["If-Modified-Since"] = state.last_modified
+    method = 'GET' if query is None else 'POST'
+    # graphql queries are paid from their own budget of points
+    resource = "core" if query is None else "graphql"
+
+    async def _attempt():
+        while True:
+            github_token = await token_pool.acquire(resource)
+            started = time.perf_counter()
+            try:
+                request = await session.request(method,
+                                                url=url,
+                                                json=query,
+                                                headers={"Authorization": f"token {github_token}", **headers})
+            except Exception as e:
+                token_pool.update(github_token, resource=resource)
+                telemetry.count("http_errors_total", method=method, error=type(e).__name__)
+                raise
+            telemetry.observe("http_request_seconds", time.perf_counter() - started, method=method)
+            telemetry.count("http_requests_total", method=method, status=request.status)
+            token_pool.update(github_token, request.headers, resource)
+            _record_tokens(resource)
+            if not TokenPool.is_exhausted(request.status, request.headers):
+                break
+            telemetry.count("rate_limited_total")
+            request.release()
+        if request.status == 304:
+            request.release()
+            return None, request
+        if request.status >= 400:
+            request.release()
+            request.raise_for_status()
+        return await request.json(), request
+
+    def _retrying(attempt: int, error: Exception, delay: float) -> None:
+        telemetry.count("http_retries_total", status=getattr(error, "status", type(error).__name__))
+        telemetry.event("retry", address=url, attempt=attempt, delay=delay, error=repr(error))
+
+    return await retry_policy.run(_attempt, _retrying)
+
+
+_PULL_QUERY = """
+query($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      databaseId number title body createdAt closedAt updatedAt merged additions deletions authorAssociation
+      author { login ... on User { databaseId } ... on Bot { databaseId } }
+      assignees(first: 100) { nodes { databaseId login } }
+      baseRepository { databaseId }
+      reviews(first: 100) {
+        pageInfo { hasNextPage }
+        nodes {
+          databaseId body state authorAssociation submittedAt
+          author { login ... on User { databaseId } ... on Bot { databaseId } }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+# commits only, the whole PR is queried only when one of them is in ApacheJIT
+_COMMITS_QUERY = """
+query($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      commits(first: 100) { pageInfo { hasNextPage } nodes { commit { oid } } }
+    }
+  }
+}
+"""
+
+
+async def _query_pr(session: aiohttp.ClientSession, link: str, query: str) -> dict:
+    owner, name, _, number = link.split("/")[-4:]
+    results, _ = await _get_results(session, f"{api_url}/graphql", query={
+        "query": query,
+        "variables": {"owner": owner, "name": name, "number": int(number)}
+    })
+    if results.get("errors"):
+        raise RuntimeError(results["errors"])
+    return results["data"]["repository"]["pullRequest"]
 
+
+async def _fetch_commits_graphql(session: aiohttp.ClientSession, link: str) -> Optional[List[list]]:
+    commits = (await _query_pr(session, link, _COMMITS_QUERY))["commits"]
+    # connections return at most 100 nodes, longer lists are read from the rest api
+    if commits["pageInfo"]["hasNextPage"]:
+        return None
+    return [[{"sha": node["commit"]["oid"]} for node in commits["nodes"]]]
+
+
+async def _fetch_pr_graphql(session: aiohttp.ClientSession,
+                            link: str) -> Tuple[dict, Optional[List[list]], Tuple[Optional[str], Optional[str]]]:
+    def _user(author: Optional[dict]) -> Optional[dict]:
+        if author is None or author.get("databaseId") is None:
+            return None
+        return {"id": author["databaseId"], "login": author["login"]}
+
+    pr = await _query_pr(session, link, _PULL_QUERY)
+    assignees = [{"id": a["databaseId"], "login": a["login"]} for a in pr["assignees"]["nodes"]]
+    # graphql results are reshaped into the form of rest api responses
+    pull = {
+        "id": pr["databaseId"],
+        "number": pr["number"],
+        "title": pr["title"],
+        "user": _user(pr["author"]),
+        "body": pr["body"],
+        "created_at": pr["createdAt"],
+        "closed_at": pr["closedAt"],
+        "assignee": assignees[0] if len(assignees) > 0 else None,
+        "assignees": assignees,
+        "base": {"repo": {"id": pr["baseRepository"]["databaseId"]}},
+        "author_association": pr["authorAssociation"],
+        "merged": pr["merged"],
+        "additions": pr["additions"],
+        "deletions": pr["deletions"]
+    }
+    review_pages = None if pr["reviews"]["pageInfo"]["hasNextPage"] else [[{
+        "id": review["databaseId"],
+        "user": _user(review["author"]),
+        "body": review["body"],
+        "state": review["state"],
+        "author_association": review["authorAssociation"],
+        "submitted_at": review["submittedAt"]
+    } for review in pr["reviews"]["nodes"]]]
+    # graphql responses have no validators, refresh asks the rest api whether the PR was modified since its update
+    updated_at = datetime.fromisoformat(pr["updatedAt"].replace("Z", "+00:00"))
+    return pull, review_pages, (None, format_datetime(updated_at, usegmt=True))
+
+
+async def _fetch_pr(session: aiohttp.ClientSession, link: str, known_commits: Set[str], buffer: WriteBehindBuffer,
+                    graphql: bool = False, state: Optional[CrawlState] = None) -> Tuple[Optional[str], Optional[str]]:
     async def _get_paginated_results(url):
-        results, request = await _get_results(url)
+        results, request = await _get_results(session, url)
         all_results = [results]
         while request.links is not None and request.links.get('next') is not None:
-            results, request = await _get_results(request.links.get('next').get('url'))
+            results, request = await _get_results(session, request.links.get('next').get('url'))
             all_results.append(results)
         return all_results
 
-    def _add_pull_to_db() -> None:
-        # pr user
-        dbsession.merge(User(
-            id=pull["user"]["id"],
-            login=pull["user"]["login"]
-        ))
-        # pr assignee
-        if pull["assignee"] is not None:
-            dbsession.merge(User(
-                id=pull["assignee"]["id"],
-                login=pull["assignee"]["login"]
-            ))
-        # pr pull
-        pr = PullRequest(
-            id=pull["id"],
-            number=pull["number"],
-            title=pull["title"],
-            user_id=pull["user"]["id"] if pull["user"] is not None else None,
-            body=pull["body"],
-            created_at=pull["created_at"],
-            closed_at=pull["closed_at"],
-            assignee_id=pull["assignee"]["id"] if pull["assignee"] is not None else None,
-            repository_id=pull["base"]["repo"]["id"],
-            author_association=AuthorAssociationEnum[pull["author_association"]],
-            merged=pull["merged"],
-            additions=pull["additions"],
-            deletions=pull["deletions"])
-        # pr assignees
-        for assignee in pull["assignees"]:
-            user = User(
-                id=assignee["id"],
-                login=assignee["login"]
-            )
-            dbsession.merge(user)
-            pr.assignees.append(user)
-        dbsession.merge(pr)
-        dbsession.commit()
-
-    def _add_reviews_to_db() -> None:
-        for page in review_pages:
-            for review in page:
-                # rev user
-                if review["user"] is not None:
-                    dbsession.merge(User(
-                        id=review["user"]["id"],
-                        login=review["user"]["login"]
-                    ))
-                # rev
-                dbsession.merge(Review(
-                    id=review["id"],
-                    pull_id=pull["id"],
-                    user_id=review["user"]["id"] if review["user"] is not None else None,
-                    body=review["body"],
-                    state=ReviewStatusesEnum[review["state"]],
-                    author_association=AuthorAssociationEnum[review["author_association"]],
-                    submitted_at=review["submitted_at"]
-                ))
-
-    try:
+    started = time.perf_counter()
+    pull = None
+    response = None
+    validators = (None, None)
+    commit_pages = None
+    review_pages = None
+    if state is not None:
+        pull, response = await _get_results(session, link, state)
+        if pull is None:
+            telemetry.count("prs_total", result="not_modified")
+            return state.etag, state.last_modified
+    if graphql:
+        commit_pages = await _fetch_commits_graphql(session, link)
+    if commit_pages is None:
         commit_pages = await _get_paginated_results(link + '/commits')
-        dbsession = db.get_session()
-
-        for page in commit_pages:
-            for commit in page:
-                if dbsession.query(Commit).get(commit['sha']):
-                    pull, _ = await _get_results(link)
-                    review_pages = await _get_paginated_results(link + '/reviews')
-                    _add_pull_to_db()
-                    _add_reviews_to_db()
-                    dbsession.commit()
-                    pr = dbsession.query(PullRequest).get(pull['id'])
-                    for page2 in commit_pages:
-                        for commit2 in page2:
-                            db_commit = dbsession.query(Commit).get(commit2['sha'])
-                            if db_commit:
-                                pr.commits.append(db_commit)
-                    dbsession.merge(pr)
-                    dbsession.commit()
-                    dbsession.close()
-                    print("Saved", pull['id'])
-                    return
-        dbsession.close()
-    except Exception as e:
-        print(f"\n[{datetime.now()}] Something went wrong\n"
-              f"\taddress:\t{link}\n"
-              f"{repr(e)}", end="")
-        await _fetch_pr(session, link)
-
-
-async def download_project_pulls(project: str) -> None:
-    started = datetime.now()
-    subpages = _count_subpages(
-        f"https://api.github.com/repos/{project}/pulls?state=closed&direction=asc&per_page=100")
-    for i in range(1, subpages + 1):
-        _print_status(f"Downloading PR subpage: {i} of {subpages} for {project} (≈{subpages * 300} requests)",
-                      (i - 1) / subpages,
-                      started)
-        links = list(map(lambda entry: entry["url"], json.loads(_fetch(
-            f"https://api.github.com/repos/{project}/pulls?state=closed&direction=asc&per_page=100&page={i}"))))
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            for link in links:
-                tasks.append(_fetch_pr(session, link))
-            await asyncio.gather(*tasks, return_exceptions=True)
-            await session.close()
-        _print_status(f"Downloading PR subpage: {i} of {subpages} for {project} (≈{subpages * 300} requests)",
-                      i / subpages, started)
-
-
-def _fetch(url: str) -> str:
-    github_token = random.choice(github_tokens)
-    try:
-        request = requests.get(url, headers={"Authorization": f"token {github_token}"},
-                               timeout=10)
-    except Exception as e:
-        print(f"\n[{datetime.now()}] Something went wrong\n"
-              f"\taddress:\t{url}\n"
-              f"{repr(e)}", end="")
-        return _fetch(url)
-    if request.status_code < 400:
-        return request.text
-    elif request.status_code == 403:
-        waiting = int(request.headers["x-ratelimit-reset"]) - int(time.time()) + 60
-        print(f"\n[{datetime.now()}] Exceeded number of requests, waiting {waiting // 60}m{waiting % 60}s", end="")
-        time.sleep(waiting)
-    else:
-        print(f"\n[{datetime.now()}] Something went wrong\n"
-              f"\tstatus:\t{request.status_code}\n"
-              f"\taddress:\t{request.url}\n"
-              f"\tnext request in 1 minute", end="")
-    return _fetch(url)
+    shas = [commit['sha'] for page in commit_pages for commit in page if commit['sha'] in known_commits]
+    if len(shas) == 0:
+        telemetry.count("prs_total", result="skipped")
+        return None, None
+
+    if graphql:
+        pull, review_pages, validators = await _fetch_pr_graphql(session, link)
+    elif pull is None:
+        pull, response = await _get_results(session, link)
+    if review_pages is None:
+        review_pages = await _get_paginated_results(link + '/reviews')
+    buffer.add_pull(pull, review_pages, shas)
+    telemetry.count("prs_total", result="saved")
+    telemetry.observe("pr_seconds", time.perf_counter() - started)
+    return _validators(response) if response is not None else validators
+
+
+def _dead_letter(buffer: WriteBehindBuffer, project: str, link: str, error: Exception) -> None:
+    # retries are done per request by the retry policy, failed PR is stored to be replayed later
+    attempts, status_code = (error.attempts, error.status) if isinstance(error, RetryError) else (1, None)
+    buffer.add_dead_letter(project, link, attempts, status_code, repr(error))
+    telemetry.count("dead_letters_total")
+    _report_error(link, error)
+
+
+async def download_project_pulls(project: str, concurrency: int, refresh: bool = False, graphql: bool = False,
+                                 replay: bool = False, pending_writes: int = 2) -> None:
+    started = time.perf_counter()
+    # PRs and requests per second over the last minute, the ETA follows the current speed
+    prs = Throughput()
+    http = Throughput()
+    links = asyncio.Queue(maxsize=concurrency * 2)
+    crawl_state = _load_crawl_state(project)
+    known_commits = _load_commit_shas(project)
+    buffer = WriteBehindBuffer()
+    # set while the buffer has room, consumers stop downloading when the writer falls behind
+    room = asyncio.Event()
+    room.set()
+    finished = False
+    # listing page url -> [PRs left, page validators]; full pages are marked completed once all their PRs are stored
+    pages = {}
+    # PR url -> its listing page, for PRs waiting in the buffer or the writer
+    page_of: Dict[str, str] = {}
+    total = 0
+    done = 0
+    # PRs requested in this run, the others were completed by earlier runs
+    fetched = 0
+    # listing page which failed after all retries, pages are never requested again in the same run
+    failed_page = None
+
+    def _is_completed(url: str) -> bool:
+        return url in crawl_state and crawl_state[url].completed_at is not None
+
+    def _has_validators(state: CrawlState) -> bool:
+        # PRs skipped by the prefilter have none, they are not revisited
+        return state.etag is not None or state.last_modified is not None
+
+    def _page_finished(page_url: str) -> None:
+        pages[page_url][0] -= 1
+        if pages[page_url][0] == 0:
+            buffer.add_crawl_state(project, page_url, *pages.pop(page_url)[1])
+
+    async def _produce() -> None:
+        nonlocal total, done, failed_page
+        page = 1
+        while True:
+            url = f"{api_url}/repos/{project}/pulls?state=closed&direction=asc&per_page=100&page={page}"
+            if _is_completed(url) and not refresh:
+                pulls = None
+            else:
+                try:
+                    pulls, request = await _get_results(session, url, crawl_state.get(url) if refresh else None)
+                except Exception as e:
+                    # the page is not completed, listing continues from it on the next run
+                    _report_error(url, e)
+                    failed_page = page
+                    break
+            if pulls is None:
+                # page completed earlier or not modified since then
+                done += 100
+                total = max(total, done)
+                page += 1
+                continue
+            if page == 1 and len(pulls) > 0:
+                buffer.add_repository(pulls[0]["base"]["repo"])
+            last = request.links.get('last')
+            total = max(total, int(last.get('url').query['page']) * 100 if last is not None else done + len(pulls))
+            todo = [pull["url"] for pull in pulls
+                    if not _is_completed(pull["url"]) or (refresh and _has_validators(crawl_state[pull["url"]]))]
+            done += len(pulls) - len(todo)
+            if len(pulls) == 100:
+                # the last page is never completed, new PRs will appear on it
+                pages[url] = [len(todo) + 1, _validators(request)]
+            for link in todo:
+                await links.put((link, url))
+            if url in pages:
+                _page_finished(url)
+            if request.links.get('next') is None:
+                break
+            page += 1
+
+    async def _replay() -> None:
+        nonlocal total
+        for link in _load_dead_letters(project):
+            total += 1
+            await links.put((link, None))
+
+    async def _consume() -> None:
+        nonlocal done, fetched
+        while True:
+            link, page_url = await links.get()
+            try:
+                await room.wait()
+                try:
+                    validators = await _fetch_pr(session, link, known_commits, buffer, graphql,
+                                                 crawl_state.get(link) if refresh else None)
+                    buffer.add_crawl_state(project, link, *validators)
+                except Exception as e:
+                    _dead_letter(buffer, project, link, e)
+                if page_url in pages:
+                    page_of[link] = page_url
+                if len(buffer.batch) >= buffer.max_size * 2:
+                    room.clear()
+            finally:
+                done += 1
+                fetched += 1
+                links.task_done()
+
+    def _flushed(batch: Batch, seconds: float, error: Optional[Exception]) -> None:
+        # a page is completed only after batches of all its PRs are committed, its state goes into a later batch
+        for url in [*batch.crawl_states, *batch.dead_letters]:
+            page_url = page_of.pop(url, None)
+            if page_url in pages:
+                if error is None:
+                    _page_finished(page_url)
+                else:
+                    pages.pop(page_url)
+        if error is None:
+            telemetry.count("db_rows_total", len(batch.pulls), table="pull")
+            telemetry.count("db_rows_total", len(batch.reviews), table="review")
+        else:
+            # PRs of the batch have no crawl state and their pages are never completed in this run,
+            # so the pages are listed and the PRs downloaded again on the next run
+            telemetry.count("db_flush_errors_total")
+            telemetry.event("flush_error", error=repr(error))
+            status.message(f"[{datetime.now()}] Failed to save downloaded data\t{repr(error)}")
+        telemetry.observe("db_flush_seconds", seconds)
+
+    writer = Writer(_flushed, pending_writes)
+
+    async def _write() -> None:
+        # committed batches can complete pages, whose states are written by one more batch
+        while not finished or len(buffer.batch) > 0 or writer.pending > 0:
+            if len(buffer.batch) == 0 or (not finished and not buffer.due):
+                await asyncio.sleep(0.5)
+                continue
+            # waits while the writer thread is still busy with earlier batches
+            await writer.submit(buffer.take())
+            room.set()
+        await writer.close()
+
+    def _status_text() -> str:
+        rate = prs.update(done)
+        requests = http.update(telemetry.total("http_requests_total"))
+        telemetry.gauge("queue_depth", links.qsize())
+        telemetry.gauge("buffer_size", len(buffer.batch))
+        telemetry.gauge("writer_pending", writer.pending)
+        remaining = token_pool.remaining("graphql" if graphql else "core")
+        flush = telemetry.merged("db_flush_seconds").quantile(0.95)
+        eta = timedelta(seconds=int((total - done) / rate)) if rate and total > done else None
+        return f"{project}: {done}/≈{total} PRs | {rate or 0:.1f} PR/s | {requests or 0:.1f} req/s | " \
+               f"queue {links.qsize()} | buffer {len(buffer.batch)} | writer {writer.pending}/{pending_writes} | " \
+               f"token budget {min(remaining.values()) if remaining else '-'} | " \
+               f"retries {int(telemetry.total('http_retries_total'))} | " \
+               f"failed {int(telemetry.total('dead_letters_total'))} | " \
+               f"flush p95 {f'{flush}s' if flush is not None else '-'} | ETA {eta or '-'}"
+
+    async def _report() -> None:
+        ticks = 0
+        while True:
+            status.update(_status_text())
+            ticks += 1
+            if ticks % 10 == 0:
+                telemetry.flush()
+            await asyncio.sleep(1)
+
+    # one connection more than workers, listing of pages never waits for a free connection
+    connector = aiohttp.TCPConnector(limit=concurrency + 1, keepalive_timeout=60)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        writer.start()
+        workers = [asyncio.create_task(_consume()) for _ in range(concurrency)]
+        writing = asyncio.create_task(_write())
+        reporter = asyncio.create_task(_report())
+        await (_replay() if replay else _produce())
+        await links.join()
+        for task in workers + [reporter]:
+            task.cancel()
+        await asyncio.gather(*workers, reporter, return_exceptions=True)
+        finished = True
+        await writing
+    # the last status stays visible, the summary starts on its own line
+    status.close()
+    print(f"{project}: downloaded {fetched} PRs, skipped {done - fetched} completed in earlier runs, "
+          f"in {timedelta(seconds=int(time.perf_counter() - started))}" +
+          (f", listing stopped at page {failed_page} and continues from it on the next run"
+           if failed_page is not None else ""))
+    telemetry.flush()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Downloads pull requests of configured projects from github")
+    parser.add_argument("--refresh", action="store_true",
+                        help="revisit already downloaded pages and PRs with conditional requests")
+    parser.add_argument("--graphql", action="store_true",
+                        help="fetch PR, its commits and reviews with a single graphql query")
+    parser.add_argument("--replay", action="store_true",
+                        help="download again only PRs which failed permanently in previous runs")
+    parser.add_argument("--metrics-json", metavar="PATH",
+                        help="append metrics snapshots and errors as json lines to the file")
+    parser.add_argument("--metrics-prometheus", metavar="PATH",
+                        help="keep metrics in the file in prometheus text format, e.g. for node exporter")
+    args = parser.parse_args()
+    if args.metrics_json:
+        telemetry.sinks.append(JsonLinesSink(args.metrics_json))
+    if args.metrics_prometheus:
+        telemetry.sinks.append(PrometheusSink(args.metrics_prometheus))
     config = ProjectConfiguration()
-    db.prepare(config.connstr)
-    github_tokens = config.gh_keys
+    # the writer thread and startup queries of the event loop are the only database users
+    db.prepare(config.connstr, pool_size=2, max_overflow=0)
+    api_url = config.api_url
+    token_pool = TokenPool(config.gh_keys, announce=status.message)
+    retry_policy = RetryPolicy(config.max_attempts)
 
     for project in config.projects:
-        asyncio.run(download_project_pulls(project))
+        asyncio.run(download_project_pulls(project, config.concurrency, args.refresh, args.graphql, args.replay,
+                                           config.pending_writes))
@@ -1,15 +1,19 @@
-from typing import Callable, Union
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
+import pandas as pd
 from sqlalchemy import or_, and_
-from sqlalchemy.orm import Query
+from sqlalchemy.orm import Query, load_only, selectinload
 
+import cache
 import db
 import metrics
 import smells
-from definitions import Repository, PullRequest
+from definitions import Repository, PullRequest, Review
 
 
-def evaluate(repo: str, evaluator: Callable, *args) -> Union[smells.Result, metrics.Result, None]:
+def evaluate(repo: str, evaluator: Callable, *args,
+             cached: bool = True) -> Union[smells.Result, metrics.Result, None]:
     session = db.get_session()
     repository = session.query(Repository).filter(Repository.full_name == repo).first()
     if repository is None:
@@ -17,16 +21,88 @@ def evaluate(repo: str, evaluator: Callable, *args) -> Union[smells.Result, metr
         print("Specified repository does not exist in specified database")
         return None
     result = evaluator(get_considered_prs(repository, session), repository, *args)
+    if cached:
+        result = cache.materialize(session, repository.id, evaluator, args, result, settings(evaluator))
     session.close()
     return result
 
 
-def get_considered_prs(repo: Repository, session) -> Query:
-    return session.query(PullRequest).filter(
-        and_(PullRequest.repository_id == repo.id,
+def settings(evaluator: Callable) -> Tuple:
+    # module settings changing results of the evaluator, results evaluated with other settings are not reused
+    return (smells.thresholds,) if evaluator.__module__ == smells.__name__ else ()
+
+
+Outcome = Tuple[str, Callable, Union[smells.Result, metrics.Result, None], Optional[Exception]]
+
+
+def _evaluate_job(repo: str, evaluator: Callable, args: Tuple) -> Outcome:
+    try:
+        return repo, evaluator, evaluate(repo, evaluator, *args), None
+    except Exception as e:
+        return repo, evaluator, None, e
+
+
+def evaluate_many(repos: List[str], evaluators: List[Union[Callable, Tuple]], workers: int = 8) -> Iterator[Outcome]:
+    # evaluators are either functions or tuples of a function and its arguments, like (smells.union, [...])
+    jobs = [(repo, *(evaluator if isinstance(evaluator, tuple) else (evaluator,))) for repo in repos
+            for evaluator in evaluators]
+    # threads, every job opens its own session from the shared connection pool
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_evaluate_job, job[0], job[1], job[2:]) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def evaluate_smells(repo: str, evaluators: List[Callable]) -> Optional[smells.Flags]:
+    session = db.get_session()
+    repository = session.query(Repository).filter(Repository.full_name == repo).first()
+    if repository is None:
+        session.close()
+        print("Specified repository does not exist in specified database")
+        return None
+    flags = smells.evaluate_all(get_considered_prs(repository, session), repository, evaluators)
+    session.close()
+    return flags
+
+
+def build_matrix(repos: List[str], metric_evaluators: List[Callable]) -> Optional[pd.DataFrame]:
+    session = db.get_session()
+    repositories = session.query(Repository).filter(Repository.full_name.in_(repos)).all()
+    if len(repositories) != len(set(repos)):
+        session.close()
+        print("One of specified repositories does not exist in specified database")
+        return None
+    matrix = metrics.build_matrix(get_considered_prs(repositories, session), metric_evaluators)
+    session.close()
+    return matrix
+
+
+_loading_profiles: Dict[str, Callable[[], List]] = {
+    "ids-only": lambda: [load_only(PullRequest.id)],
+    "with-commits": lambda: [selectinload(PullRequest.commits)],
+    "with-reviews": lambda: [selectinload(PullRequest.reviews).selectinload(Review.user)],
+    "full": lambda: [selectinload(PullRequest.commits),
+                     selectinload(PullRequest.reviews).selectinload(Review.user),
+                     selectinload(PullRequest.assignees),
+                     selectinload(PullRequest.user),
+                     selectinload(PullRequest.assignee)]
+}
+
+
+def get_considered_prs(repo: Union[Repository, List[Repository]], session, profile: Optional[str] = None,
+                       batch_size: int = 1000) -> Query:
+    if profile is not None and profile not in _loading_profiles:
+        raise ValueError(f"Unknown loading profile {profile}, expected one of {', '.join(_loading_profiles)}")
+    repo_ids = [r.id for r in repo] if isinstance(repo, list) else [repo.id]
+    considered = session.query(PullRequest).filter(
+        and_(PullRequest.repository_id.in_(repo_ids),
              or_(
                  PullRequest.deletions > 0,
                  PullRequest.additions > 0)
              ),
         PullRequest.merged
     )
+    if profile is None:
+        return considered
+    # streamed in batches, relationships are loaded with one SELECT per batch of PRs instead of one per PR
+    return considered.options(*_loading_profiles[profile]()).yield_per(batch_size)
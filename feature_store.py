@@ -0,0 +1,136 @@
+import argparse
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import Table, Integer, Float, Boolean, DateTime, Enum, select
+from sqlalchemy.sql import Select
+
+import db
+import features
+from configuration import ProjectConfiguration
+from definitions import Repository, PullRequest, Review, Commit, pulls_commits_table, pulls_assignees_table
+
+
+def _arrow_type(column) -> pa.DataType:
+    if isinstance(column.type, Enum):
+        return pa.string()
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    return pa.string()
+
+
+def _converter(column) -> Callable:
+    if isinstance(column.type, Enum):
+        return lambda value: value.name if value is not None else None
+    return lambda value: value
+
+
+def _pull_ids(repo: Repository):
+    return select(PullRequest.id).where(PullRequest.repository_id == repo.id)
+
+
+def _selects(repo: Repository) -> Dict[str, Tuple[Table, Select]]:
+    pull_ids = _pull_ids(repo)
+    commit_ids = select(pulls_commits_table.c.commit_id).where(pulls_commits_table.c.pull_id.in_(pull_ids))
+    tables = {
+        "pull": (PullRequest.__table__, PullRequest.repository_id == repo.id),
+        "review": (Review.__table__, Review.pull_id.in_(pull_ids)),
+        "pulls_commits": (pulls_commits_table, pulls_commits_table.c.pull_id.in_(pull_ids)),
+        "pulls_assignees": (pulls_assignees_table, pulls_assignees_table.c.pull_id.in_(pull_ids)),
+        "commit": (Commit.__table__, Commit.id.in_(commit_ids))
+    }
+    return {name: (table, select(table).where(condition)) for name, (table, condition) in tables.items()}
+
+
+def _directory(root: str, repo_name: str) -> str:
+    return os.path.join(root, repo_name.replace("/", "__"))
+
+
+def _export_table(connection, table: Table, statement: Select, path: str, batch_size: int) -> int:
+    columns = list(table.columns)
+    schema = pa.schema([(column.name, _arrow_type(column)) for column in columns])
+    converters = [_converter(column) for column in columns]
+    exported = 0
+    temporary = f"{path}.tmp"
+    # server side cursor, rows are fetched and written batch by batch
+    result = connection.execution_options(stream_results=True, max_row_buffer=batch_size).execute(statement)
+    with pa.OSFile(temporary, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for rows in result.partitions(batch_size):
+            arrays = [pa.array([convert(row[i]) for row in rows], type=field.type)
+                      for i, (convert, field) in enumerate(zip(converters, schema))]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            exported += len(rows)
+    os.replace(temporary, path)
+    return exported
+
+
+def export(repos: List[str], root: str = "store", batch_size: int = 50000) -> None:
+    session = db.get_session()
+    for repo_name in repos:
+        repository = session.query(Repository).filter(Repository.full_name == repo_name).first()
+        if repository is None:
+            print(f"Repository {repo_name} does not exist in specified database")
+            continue
+        started = time.time()
+        directory = _directory(root, repo_name)
+        os.makedirs(directory, exist_ok=True)
+        with db.engine.connect() as connection:
+            for name, (table, statement) in _selects(repository).items():
+                exported = _export_table(connection, table, statement, os.path.join(directory, f"{name}.arrow"),
+                                         batch_size)
+                print(f"Exported {exported} rows of {name} for {repo_name}")
+        print(f"Exported {repo_name} in {time.time() - started:.1f}s")
+    session.close()
+
+
+class Store:
+    def __init__(self, repo_name: str, root: str = "store"):
+        self.repo_name = repo_name
+        self.directory = _directory(root, repo_name)
+        self._tables: Dict[str, pa.Table] = {}
+
+    def table(self, name: str) -> pa.Table:
+        if name not in self._tables:
+            # memory mapped arrow files are paged in by the OS instead of being read up front
+            source = pa.memory_map(os.path.join(self.directory, f"{name}.arrow"), "r")
+            self._tables[name] = pa.ipc.open_file(source).read_all()
+        return self._tables[name]
+
+    def frame(self, name: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        table = self.table(name)
+        return (table.select(columns) if columns is not None else table).to_pandas()
+
+    def considered_pulls(self) -> pd.DataFrame:
+        pulls = self.frame("pull")
+        return pulls[pulls["merged"].fillna(False) & ((pulls["additions"] > 0) | (pulls["deletions"] > 0))]
+
+    def commit_features(self, proportion: float = 0.1) -> pd.DataFrame:
+        considered = self.considered_pulls()["id"]
+        links = self.frame("pulls_commits", ["pull_id", "commit_id"])
+        links = links[links["pull_id"].isin(considered)]
+        commits = self.frame("commit", ["id", "buggy", *features.commit_columns])
+        return features.commit_features(links["pull_id"].to_numpy(), links["commit_id"].to_numpy(), commits, proportion)
+
+
+def load(repos: List[str], root: str = "store") -> pd.DataFrame:
+    return pd.concat([Store(repo_name, root).commit_features() for repo_name in repos])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exports PRs, reviews and commits of configured projects "
+                                                 "into Arrow files, one directory per repository")
+    parser.add_argument("--output", default="store", help="directory of exported files")
+    parser.add_argument("--batch-size", type=int, default=50000, help="rows fetched from the server at once")
+    args = parser.parse_args()
+    config = ProjectConfiguration()
+    db.prepare(config.connstr)
+    export(config.projects, args.output, args.batch_size)
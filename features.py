@@ -0,0 +1,93 @@
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+import db
+from definitions import Repository, PullRequest, Commit, pulls_commits_table
+from evaluator import get_considered_prs
+
+# ApacheJIT columns aggregated over the commits of every PR
+commit_columns = ["la", "ld", "nf", "nd", "ns", "ent", "ndev", "age", "nuc", "aexp", "arexp", "asexp"]
+
+Links = Tuple[np.ndarray, np.ndarray]
+
+
+def _empty() -> pd.DataFrame:
+    names = ["buggy", *[f"{name}_{kind}" for name in commit_columns for kind in ("min", "avg", "max")]]
+    return pd.DataFrame(columns=names, index=pd.Index([], name="pull_id", dtype=np.int64))
+
+
+def commit_features(pull_ids: np.ndarray, commit_ids: np.ndarray, commits: pd.DataFrame,
+                    proportion: float = 0.1) -> pd.DataFrame:
+    # commits has columns id, buggy and commit_columns, links to commits missing from it are skipped
+    rows = pd.Index(commits["id"]).get_indexer(commit_ids)
+    known = rows >= 0
+    order = np.argsort(pull_ids[known], kind="stable")
+    pull_ids, rows = pull_ids[known][order], rows[known][order]
+    if len(pull_ids) == 0:
+        return _empty()
+    # every PR is a segment of consecutive links
+    starts = np.flatnonzero(np.r_[True, pull_ids[1:] != pull_ids[:-1]])
+    sizes = np.diff(np.r_[starts, len(pull_ids)])
+    # like scipy.stats.trim_mean, proportion of the smallest and largest values is cut off in every PR
+    cut = (sizes * proportion).astype(np.int64)
+    positions = np.arange(len(pull_ids)) - np.repeat(starts, sizes)
+    kept = (positions >= np.repeat(cut, sizes)) & (positions < np.repeat(sizes - cut, sizes))
+    features = {"pull_id": pull_ids[starts],
+                "buggy": np.logical_or.reduceat(commits["buggy"].to_numpy(dtype=bool)[rows], starts)}
+    for name in commit_columns:
+        values = commits[name].to_numpy()[rows]
+        # sorted by value within every PR, segments stay where they are
+        values = values[np.lexsort((values, pull_ids))]
+        features[f"{name}_min"] = values[starts]
+        features[f"{name}_avg"] = np.add.reduceat(np.where(kept, values, 0), starts) / (sizes - 2 * cut)
+        features[f"{name}_max"] = values[starts + sizes - 1]
+    return pd.DataFrame(features).set_index("pull_id")
+
+
+def commit_features_chunked(links: Iterable[Links], commits: pd.DataFrame, proportion: float = 0.1) -> pd.DataFrame:
+    # chunks are ordered by pull id, links of the last PR of a chunk may continue in the next chunk
+    results = []
+    carried_pulls, carried_commits = np.array([], dtype=np.int64), np.array([], dtype=object)
+    for pull_ids, commit_ids in links:
+        pull_ids, commit_ids = np.concatenate([carried_pulls, pull_ids]), np.concatenate([carried_commits, commit_ids])
+        if len(pull_ids) == 0:
+            continue
+        split = np.searchsorted(pull_ids, pull_ids[-1])
+        if split > 0:
+            results.append(commit_features(pull_ids[:split], commit_ids[:split], commits, proportion))
+        carried_pulls, carried_commits = pull_ids[split:], commit_ids[split:]
+    if len(carried_pulls) > 0:
+        results.append(commit_features(carried_pulls, carried_commits, commits, proportion))
+    return pd.concat(results) if len(results) > 0 else _empty()
+
+
+def _stream_links(session, considered, batch_size: int) -> Iterator[Links]:
+    statement = select(pulls_commits_table.c.pull_id, pulls_commits_table.c.commit_id) \
+        .where(pulls_commits_table.c.pull_id.in_(considered)) \
+        .order_by(pulls_commits_table.c.pull_id)
+    result = session.execute(statement, execution_options={"stream_results": True})
+    for partition in result.partitions(batch_size):
+        pull_ids, commit_ids = zip(*partition)
+        yield np.array(pull_ids, dtype=np.int64), np.array(commit_ids, dtype=object)
+
+
+def build_commit_features(repos: List[str], proportion: float = 0.1,
+                          batch_size: int = 1_000_000) -> Optional[pd.DataFrame]:
+    session = db.get_session()
+    repositories = session.query(Repository).filter(Repository.full_name.in_(repos)).all()
+    if len(repositories) != len(set(repos)):
+        session.close()
+        print("One of specified repositories does not exist in specified database")
+        return None
+    considered = get_considered_prs(repositories, session).with_entities(PullRequest.id).subquery()
+    linked = select(pulls_commits_table.c.commit_id).where(pulls_commits_table.c.pull_id.in_(select(considered)))
+    columns = ["id", "buggy", *commit_columns]
+    statement = select(*[Commit.__table__.c[name] for name in columns]).where(Commit.id.in_(linked))
+    commits = pd.DataFrame(session.execute(statement).all(), columns=columns)
+    # only the link table is streamed, commits of ApacheJIT fit in memory
+    features = commit_features_chunked(_stream_links(session, select(considered), batch_size), commits, proportion)
+    session.close()
+    return features
@@ -0,0 +1,79 @@
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import ColumnElement
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import Float, Integer
+
+
+# SQL functions used by smells and metrics, compiled for every supported database,
+# PostgreSQL syntax is the default
+
+
+class epoch(FunctionElement):
+    type = Float()
+    name = "epoch"
+    inherit_cache = True
+
+
+class trunc(FunctionElement):
+    type = Float()
+    name = "trunc"
+    inherit_cache = True
+
+
+class div(FunctionElement):
+    type = Integer()
+    name = "div"
+    inherit_cache = True
+
+
+class char_length(FunctionElement):
+    type = Integer()
+    name = "char_length"
+    inherit_cache = True
+
+
+def seconds_between(start: ColumnElement, end: ColumnElement) -> ColumnElement:
+    return epoch(end) - epoch(start)
+
+
+@compiles(epoch)
+def _epoch(element, compiler, **kw) -> str:
+    return f"EXTRACT(epoch FROM {compiler.process(element.clauses, **kw)})"
+
+
+@compiles(epoch, "sqlite")
+def _epoch_sqlite(element, compiler, **kw) -> str:
+    # real, so divisions of seconds are not integer divisions
+    return f"CAST(strftime('%s', {compiler.process(element.clauses, **kw)}) AS REAL)"
+
+
+@compiles(trunc)
+def _trunc(element, compiler, **kw) -> str:
+    return f"trunc({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(trunc, "sqlite")
+def _trunc_sqlite(element, compiler, **kw) -> str:
+    # real like the numeric trunc of PostgreSQL, so dividing by it is not an integer division
+    return f"CAST(CAST({compiler.process(element.clauses, **kw)} AS INTEGER) AS REAL)"
+
+
+@compiles(div)
+def _div(element, compiler, **kw) -> str:
+    return f"div({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(div, "sqlite")
+def _div_sqlite(element, compiler, **kw) -> str:
+    dividend, divisor = [compiler.process(clause, **kw) for clause in element.clauses]
+    return f"CAST(CAST(({dividend}) AS REAL) / ({divisor}) AS INTEGER)"
+
+
+@compiles(char_length)
+def _char_length(element, compiler, **kw) -> str:
+    return f"char_length({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(char_length, "sqlite")
+def _char_length_sqlite(element, compiler, **kw) -> str:
+    return f"length({compiler.process(element.clauses, **kw)})"
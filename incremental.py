@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+from sqlalchemy import select, literal, case, and_, or_, true
+from sqlalchemy.orm import Query
+
+import cache
+import db
+import metrics
+import smells
+from definitions import Repository, PullRequest, PullSmell, PullMetric, EvaluationWatermark
+from evaluator import get_considered_prs, settings
+
+# PRs flushed while an evaluation runs may be stamped a moment before it started, they are evaluated again
+_overlap = timedelta(minutes=1)
+
+
+def _name(evaluator: Callable) -> str:
+    return f"{evaluator.__module__}.{evaluator.__name__}"
+
+
+def _settings(evaluator: Callable) -> str:
+    # stored results are recomputed from scratch when the implementation or thresholds change
+    return f"{cache.source_hash(evaluator)}|{settings(evaluator)}"
+
+
+def _changed(connection, repository: Repository, evaluator: Callable, full: bool):
+    watermark = connection.execute(select(EvaluationWatermark.settings, EvaluationWatermark.evaluated_at)
+                                   .where(EvaluationWatermark.repository_id == repository.id,
+                                          EvaluationWatermark.evaluator == _name(evaluator))).first()
+    if full or watermark is None or watermark.settings != _settings(evaluator):
+        return true()
+    changed = PullRequest.updated_at >= watermark.evaluated_at - _overlap
+    if smells.is_repository_wide(evaluator):
+        authors = select(PullRequest.user_id).where(PullRequest.repository_id == repository.id, changed).distinct()
+        changed = or_(changed, PullRequest.user_id.in_(authors))
+    return changed
+
+
+def _refresh(connection, considered: Query, repository: Repository, evaluator: Callable, full: bool) -> int:
+    started = datetime.now()
+    changed = _changed(connection, repository, evaluator, full)
+    if evaluator in smells.evaluators():
+        rows = considered.filter(changed).with_entities(
+            PullRequest.id.label("pull_id"),
+            literal(evaluator.__name__).label("smell"),
+            case((smells.expression(evaluator, repository), True), else_=False).label("smelly")).statement
+        statement = db.insert_on_conflict(PullSmell.__table__, ["pull_id", "smell"], ["smelly"], rows)
+    else:
+        rows = metrics.with_review_stats(considered).filter(changed).with_entities(
+            PullRequest.id.label("pull_id"),
+            literal(metrics.name(evaluator)).label("metric"),
+            metrics.expression(evaluator).label("value")).statement
+        statement = db.insert_on_conflict(PullMetric.__table__, ["pull_id", "metric"], ["value"], rows)
+    evaluated = connection.execute(statement).rowcount
+    connection.execute(db.insert_on_conflict(EvaluationWatermark.__table__, ["repository_id", "evaluator"],
+                                             ["settings", "evaluated_at"]),
+                       {"repository_id": repository.id, "evaluator": _name(evaluator),
+                        "settings": _settings(evaluator), "evaluated_at": started})
+    return evaluated
+
+
+def _check(evaluators: List[Callable]) -> None:
+    for evaluator in evaluators:
+        if evaluator not in smells.evaluators() and evaluator not in metrics.evaluators():
+            raise ValueError(f"Incremental evaluation of {evaluator.__name__} is not supported")
+
+
+def refresh(repo: str, evaluators: List[Callable], full: bool = False) -> Optional[Dict[Callable, int]]:
+    _check(evaluators)
+    session = db.get_session()
+    repository = session.query(Repository).filter(Repository.full_name == repo).first()
+    if repository is None:
+        session.close()
+        print("Specified repository does not exist in specified database")
+        return None
+    # only PRs changed since the watermark of an evaluator are evaluated, see _changed
+    considered = get_considered_prs(repository, session)
+    with db.engine.begin() as connection:
+        evaluated = {evaluator: _refresh(connection, considered, repository, evaluator, full)
+                     for evaluator in evaluators}
+    session.close()
+    return evaluated
+
+
+def evaluate(repo: str, evaluator: Callable, full: bool = False) -> Union[smells.Result, metrics.Result, None]:
+    if refresh(repo, [evaluator], full) is None:
+        return None
+    session = db.get_session()
+    repository = session.query(Repository).filter(Repository.full_name == repo).first()
+    considered = get_considered_prs(repository, session, "ids-only")
+    # repository level results are read from stored per PR results, nothing is evaluated again
+    if evaluator in smells.evaluators():
+        rows = considered.outerjoin(PullSmell, and_(PullSmell.pull_id == PullRequest.id,
+                                                    PullSmell.smell == evaluator.__name__)) \
+            .with_entities(PullRequest.id, PullSmell.smelly) \
+            .order_by(PullRequest.id) \
+            .all()
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        flags = np.array([bool(row[1]) for row in rows], dtype=bool)
+        result = smells.Result(smells.name(evaluator), repository, considered, None)
+        result.load({"considered": ids, "smelly": ids[flags]})
+    else:
+        name = metrics.name(evaluator)
+        rows = considered.outerjoin(PullMetric, and_(PullMetric.pull_id == PullRequest.id, PullMetric.metric == name)) \
+            .with_entities(PullRequest.id, PullMetric.value) \
+            .order_by(PullRequest.id) \
+            .all()
+        result = metrics.Result(name, repository, considered, None)
+        result.load({"pull_id": np.array([row[0] for row in rows], dtype=np.int64),
+                     "values": np.array([row[1] if row[1] is not None else np.nan for row in rows], dtype=np.float64)})
+    session.close()
+    return result
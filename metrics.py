@@ -1,9 +1,13 @@
-from typing import List
+from typing import List, Callable, Dict, Tuple, Optional
 
-from sqlalchemy import func, extract, select, column
-from sqlalchemy.orm import Query, Session
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select, column, case
+from sqlalchemy.orm import Query
+from sqlalchemy.sql import ColumnElement
 
-from definitions import Repository, PullRequest, Review
+import functions
+from definitions import Repository, PullRequest, PullReviewStats, Commit, pulls_commits_table
 
 
 class Result:
@@ -12,138 +16,86 @@ class Result:
         self.repo = repo
         self.considered = considered
         self.evaluated = evaluated
+        self.arrays: Optional[Dict[str, np.ndarray]] = None
 		
+    def _loaded(self) -> Dict[str, np.ndarray]:
+        if self.arrays is None:
+            self.load(self.materialize())
+        return self.arrays
+
     @property
     def considered_count(self) -> int:
-        return self.considered.count()
+        return len(self._loaded()["pull_id"])
+
+    def materialize(self) -> Dict[str, np.ndarray]:
+        # ordered by id like the matrix and incremental results, so values of different metrics line up
+        rows = self.considered.session.execute(
+            select(column("id"), column(self.metric_name)).select_from(self.evaluated.subquery())
+            .order_by(column("id"))).all()
+        return {
+            "pull_id": np.array([row[0] for row in rows], dtype=np.int64),
+            "values": np.array([float(row[1]) if row[1] is not None else np.nan for row in rows], dtype=np.float64)
+        }
+
+    def load(self, arrays: Dict[str, np.ndarray]) -> None:
+        self.arrays = arrays
 
     def to_list(self, session) -> List[float]:
-        measures = list(
-            map(lambda r: float(r[0]) if r[0] is not None else None,
-                session.execute(select(column(self.metric_name)).select_from(self.evaluated.subquery())).all()))
+        # evaluated once, later calls read the materialized values
+        measures = [None if np.isnan(value) else value for value in self._loaded()["values"].tolist()]
         numeric_entries = list(filter(lambda e: e is not None, measures))
         average = sum(numeric_entries) / len(numeric_entries) if len(numeric_entries) > 0 else float("nan")
         return list(map(lambda e: e if e is not None else average, measures))
 
 
-# noinspection PyTypeChecker
+def _review_seconds() -> ColumnElement:
+    return functions.seconds_between(PullRequest.created_at, PullRequest.closed_at)
+
+
+def _changed_lines() -> ColumnElement:
+    return PullRequest.additions + PullRequest.deletions
+
+
+def with_review_stats(considered: Query) -> Query:
+    return considered.outerjoin(PullReviewStats, PullReviewStats.pull_id == PullRequest.id)
+
+
+def _evaluate(metric: Callable, considered: Query, repo: Repository) -> Result:
+    # noinspection PyTypeChecker
+    return Result(name(metric), repo, considered,
+                  with_review_stats(considered).add_columns(expression(metric).label(name(metric))))
+
+
 def review_window_metric(considered: Query, repo: Repository) -> Result:
-    name = "review_window"
-    return Result(name,
-                  repo,
-                  considered,
-                  considered.add_columns((
-                                             func.trunc(
-                                                 (
-                                                         extract('epoch', PullRequest.closed_at) -
-                                                         extract('epoch', PullRequest.created_at)
-                                                 ) / 60)
-                                         ).label(name))
-                  )
-
-
-# noinspection PyTypeChecker
+    return _evaluate(review_window_metric, considered, repo)
+
+
 def review_window_per_line_metric(considered: Query, repo: Repository) -> Result:
-    name = "review_window_per_line"
-    return Result(name,
-                  repo,
-                  considered,
-                  considered.add_columns((
-                                             func.trunc(
-                                                 (
-                                                         extract('epoch', PullRequest.closed_at) -
-                                                         extract('epoch', PullRequest.created_at)
-                                                 ) / 60 / (PullRequest.additions + PullRequest.deletions))
-                                         ).label(name))
-                  )
-
-
-# noinspection PyTypeChecker
+    return _evaluate(review_window_per_line_metric, considered, repo)
+
+
 def review_chars(considered: Query, repo: Repository) -> Result:
-    name = "review_chars"
-    return Result(name,
-                  repo,
-                  considered,
-                  considered.add_columns(
-                      (Session().query((
-                                           func.sum(func.char_length(Review.body)))
-                                       .filter(PullRequest.id == Review.pull_id))
-                       ).label(name)))
-
-
-# noinspection PyTypeChecker
-def review_chars_code_lines_ratio(considered: Query, repo: Repository):
-    name = "review_chars_per_loc"
-    return Result(name,
-                  repo,
-                  considered,
-                  considered.add_columns(
-                      Session().query(
-                          func.div(
-                              func.sum(func.char_length(Review.body)).filter(PullRequest.id == Review.pull_id),
-                              (
-                                      PullRequest.additions + PullRequest.deletions
-                              )
-                          )
-                      ).label(name)
-                  )
-                  )
-
-
-# noinspection PyTypeChecker
-def reviewed_lines_per_hour(considered: Query, repo: Repository):
-    name = "reviewed_lines_per_hour"
-    return Result(name,
-                  repo,
-                  considered,
-                  considered.add_columns(
-                      Session().query(
-                          # func.div(
-                          func.sum(func.char_length(Review.body)).filter(PullRequest.id == Review.pull_id) /
-                          func.trunc((
-                                  extract('epoch', PullRequest.closed_at) -
-                                  extract('epoch', PullRequest.created_at)
-                          ))
-                          # )
-                      ).label(name)
-                  )
-                  )
-
-
-# noinspection PyTypeChecker
+    return _evaluate(review_chars, considered, repo)
+
+
+def review_chars_code_lines_ratio(considered: Query, repo: Repository) -> Result:
+    return _evaluate(review_chars_code_lines_ratio, considered, repo)
+
+
+def reviewed_lines_per_hour(considered: Query, repo: Repository) -> Result:
+    return _evaluate(reviewed_lines_per_hour, considered, repo)
+
+
 def no_of_reviewers(considered: Query, repo: Repository) -> Result:
-    name = "no_of_reviewers"
-    return Result(name,
-                  repo,
-                  considered,
-                  considered.add_columns(
-                      (Session().query((func.count(Review.user_id.distinct()).filter(PullRequest.id == Review.pull_id)))).label(
-                          name)))
+    return _evaluate(no_of_reviewers, considered, repo)
 
 
-# noinspection PyTypeChecker
 def no_of_reviewers_diff_than_author(considered: Query, repo: Repository) -> Result:
-    name = "no_of_reviewers_diff_than_author"
-    return Result(name,
-                  repo,
-                  considered,
-                  considered.add_columns(
-                      (Session().query((func.count(Review.user_id.distinct()).filter(
-                          PullRequest.id == Review.pull_id and PullRequest.user_id != Review.user_id)))).label(
-                          name)))
+    return _evaluate(no_of_reviewers_diff_than_author, considered, repo)
 
 
-# noinspection PyTypeChecker
 def no_of_reviews(considered: Query, repo: Repository) -> Result:
-    name = "no_of_reviews"
-    return Result(name,
-                  repo,
-                  considered,
-                  considered.add_columns(
-                      (Session().query((func.count(Review.id).filter(
-                          PullRequest.id == Review.pull_id)))).label(
-                          name))
-                  )
+    return _evaluate(no_of_reviews, considered, repo)
 
 
 # def no_of_fixes(considered: Query, repo: Repository) -> Result:
@@ -157,14 +109,67 @@ def no_of_reviews(considered: Query, repo: Repository) -> Result:
 #     )
 
 
-# noinspection PyTypeChecker
 def ping_pong(considered: Query, repo: Repository) -> Result:
-    name = "ping_pong"
-    return Result(name,
-                  repo,
-                  considered,
-                  considered.add_columns(
-                      (Session().query((func.count(Review.id).filter(
-                          PullRequest.id == Review.pull_id and func.count(Review.id) > 3)))).label(
-                          name))
-                  )
+    return _evaluate(ping_pong, considered, repo)
+
+
+# metric name and its expression over the PR joined with its pull_review_stats row, values are the same as in the
+# original per PR subqueries, where python's `and` dropped the author and ping-pong conditions (see readme)
+_metrics: Dict[Callable, Tuple[str, Callable[[], ColumnElement]]] = {
+    review_window_metric: ("review_window",
+                           lambda: functions.trunc(_review_seconds() / 60)),
+    review_window_per_line_metric: ("review_window_per_line",
+                                    lambda: functions.trunc(_review_seconds() / 60 / _changed_lines())),
+    review_chars: ("review_chars",
+                   lambda: PullReviewStats.body_chars),
+    review_chars_code_lines_ratio: ("review_chars_per_loc",
+                                    lambda: functions.div(PullReviewStats.body_chars, _changed_lines())),
+    reviewed_lines_per_hour: ("reviewed_lines_per_hour",
+                              lambda: PullReviewStats.body_chars / func.nullif(functions.trunc(_review_seconds()), 0)),
+    no_of_reviewers: ("no_of_reviewers",
+                      lambda: func.coalesce(PullReviewStats.reviewer_count, 0)),
+    no_of_reviewers_diff_than_author: ("no_of_reviewers_diff_than_author",
+                                       lambda: func.coalesce(PullReviewStats.reviewer_count, 0)),
+    no_of_reviews: ("no_of_reviews",
+                    lambda: func.coalesce(PullReviewStats.review_count, 0)),
+    ping_pong: ("ping_pong",
+                lambda: func.coalesce(PullReviewStats.review_count, 0))
+}
+
+
+def evaluators() -> List[Callable]:
+    return list(_metrics)
+
+
+def name(evaluator: Callable) -> str:
+    return _metrics[evaluator][0]
+
+
+def expression(evaluator: Callable) -> ColumnElement:
+    # value of the metric for a PR of a query joined by with_review_stats
+    return _metrics[evaluator][1]()
+
+
+def matrix_query(considered: Query, metrics: List[Callable]) -> Query:
+    buggy = select(pulls_commits_table.c.pull_id,
+                   func.max(case((Commit.buggy, 1), else_=0)).label("buggy")) \
+        .join(Commit, Commit.id == pulls_commits_table.c.commit_id) \
+        .group_by(pulls_commits_table.c.pull_id) \
+        .subquery()
+    return with_review_stats(considered) \
+        .outerjoin(buggy, buggy.c.pull_id == PullRequest.id) \
+        .with_entities(PullRequest.id,
+                       PullRequest.repository_id,
+                       *[expression(metric).label(name(metric)) for metric in metrics],
+                       func.coalesce(buggy.c.buggy, 0)) \
+        .order_by(PullRequest.id)
+
+
+def build_matrix(considered: Query, metrics: List[Callable]) -> pd.DataFrame:
+    names = [_metrics[metric][0] for metric in metrics]
+    df = pd.DataFrame(matrix_query(considered, metrics).all(), columns=["pull_id", "repository_id", *names, "buggy"])
+    df[names] = df[names].astype(float)
+    # missing values are replaced with the mean of the metric in the repository, like in Result.to_list
+    df[names] = df[names].fillna(df.groupby("repository_id")[names].transform("mean"))
+    df["buggy"] = df["buggy"] > 0
+    return df
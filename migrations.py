@@ -0,0 +1,95 @@
+from datetime import datetime
+from typing import Callable, List
+
+from sqlalchemy import Table, Boolean, and_, or_, column, func, select, inspect, text, update
+
+import review_stats
+import text_features
+from definitions import SchemaVersion, PullRequest, pulls_commits_table, pulls_assignees_table
+
+
+def _backfill_review_stats(connection) -> None:
+    review_stats.refresh(connection)
+
+
+def _backfill_reviewer_pairs(connection) -> None:
+    review_stats.refresh_pairs(connection)
+
+
+def _add_link_primary_key(connection, table: Table) -> None:
+    columns = [column.name for column in table.primary_key.columns]
+    if inspect(connection).get_pk_constraint(table.name)["constrained_columns"]:
+        return
+    # duplicated links accumulated while the table had no primary key
+    rows = connection.execute(select(*[table.c[name] for name in columns]).distinct()
+                              .where(*[table.c[name].isnot(None) for name in columns])).all()
+    connection.execute(table.delete())
+    if len(rows) > 0:
+        connection.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+    if connection.dialect.name == "sqlite":
+        # sqlite cannot add a primary key to an existing table, unique index gives the same guarantees
+        connection.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS pk_{table.name} ON {table.name} "
+                                f"({', '.join(columns)})"))
+    else:
+        connection.execute(text(f"ALTER TABLE {table.name} ADD PRIMARY KEY ({', '.join(columns)})"))
+
+
+def _create_index(connection, table: str, name: str, columns: List[str], where=None) -> None:
+    # migrations must not depend on the current model, indexes are created from their definition at that version
+    condition = "" if where is None else \
+        f" WHERE {where.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})}"
+    connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)}){condition}"))
+
+
+# predicate of evaluator.get_considered_prs
+_considered = and_(column("merged", Boolean), or_(column("additions") > 0, column("deletions") > 0))
+
+_indexes = [
+    ("review", "ix_review_pull_id_user_id", ["pull_id", "user_id"], None),
+    ("review", "ix_review_user_id_pull_id", ["user_id", "pull_id"], None),
+    ("pull", "ix_pull_repository_id_user_id", ["repository_id", "user_id"], None),
+    ("pull", "ix_pull_user_id", ["user_id"], None),
+    ("pull", "ix_pull_assignee_id", ["assignee_id"], None),
+    ("pull", "ix_pull_considered", ["repository_id", "id"], _considered),
+    ("pulls_commits", "ix_pulls_commits_pull_id", ["pull_id"], None),
+    ("pulls_assignees", "ix_pulls_assignees_pull_id", ["pull_id"], None)
+]
+
+
+def _add_indexes(connection) -> None:
+    _add_link_primary_key(connection, pulls_commits_table)
+    _add_link_primary_key(connection, pulls_assignees_table)
+    for table, name, columns, where in _indexes:
+        _create_index(connection, table, name, columns, where)
+
+
+def _add_pull_updated_at(connection) -> None:
+    table = PullRequest.__table__
+    if "updated_at" not in [column["name"] for column in inspect(connection).get_columns(table.name)]:
+        connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN updated_at "
+                                f"{table.c.updated_at.type.compile(connection.dialect)}"))
+    connection.execute(update(table).where(table.c.updated_at.is_(None)).values(updated_at=datetime.now()))
+    _create_index(connection, table.name, "ix_pull_repository_id_updated_at", ["repository_id", "updated_at"])
+
+
+def _backfill_text_features(connection) -> None:
+    text_features.backfill(connection)
+
+
+# append only, position in the list is the schema version
+_migrations: List[Callable] = [
+    _backfill_review_stats,
+    _add_indexes,
+    _backfill_reviewer_pairs,
+    _add_pull_updated_at,
+    _backfill_text_features
+]
+
+
+def upgrade(connection, fresh: bool) -> None:
+    current = connection.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+    for version in range(current + 1, len(_migrations) + 1):
+        if not fresh:
+            print(f"Migrating database to version {version} ({_migrations[version - 1].__name__})")
+            _migrations[version - 1](connection)
+        connection.execute(SchemaVersion.__table__.insert().values(version=version, applied_at=datetime.now()))
@@ -0,0 +1,197 @@
+import asyncio
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import Table
+
+import cache
+import db
+import review_stats
+import text_features
+from definitions import User, Repository, PullRequest, Review, CrawlState, DeadLetter, AuthorAssociationEnum, \
+    ReviewStatusesEnum, pulls_commits_table, pulls_assignees_table
+
+
+def _timestamp(value: Optional[str]) -> Optional[datetime]:
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ") if value is not None else None
+
+
+class Batch:
+    def __init__(self):
+        self.users: Dict[int, dict] = {}
+        self.repositories: Dict[int, dict] = {}
+        self.pulls: Dict[int, dict] = {}
+        self.reviews: Dict[int, dict] = {}
+        self.pulls_commits: Set[Tuple[int, str]] = set()
+        self.pulls_assignees: Set[Tuple[int, int]] = set()
+        self.crawl_states: Dict[str, dict] = {}
+        self.dead_letters: Dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self.pulls) + len(self.crawl_states) + len(self.dead_letters)
+
+    def flush(self) -> None:
+        with db.engine.begin() as connection:
+            def _upsert(table: Table, rows: List[dict], key: str) -> None:
+                if len(rows) > 0:
+                    connection.execute(
+                        db.insert_on_conflict(table, [key], [name for name in rows[0] if name != key]), rows)
+
+            def _replace_links(table: Table, rows: Set[Tuple], columns: Tuple[str, str]) -> None:
+                connection.execute(table.delete().where(table.c.pull_id.in_(list(self.pulls))))
+                if len(rows) > 0:
+                    connection.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+
+            updated_at = datetime.now()
+            _upsert(User.__table__, list(self.users.values()), "id")
+            _upsert(Repository.__table__, list(self.repositories.values()), "id")
+            _upsert(PullRequest.__table__, [{**pull, "updated_at": updated_at} for pull in self.pulls.values()], "id")
+            _upsert(Review.__table__, list(self.reviews.values()), "id")
+            if len(self.pulls) > 0:
+                _replace_links(pulls_commits_table, self.pulls_commits, ("pull_id", "commit_id"))
+                _replace_links(pulls_assignees_table, self.pulls_assignees, ("pull_id", "assignee_id"))
+                review_stats.refresh(connection, self.pulls)
+                review_stats.refresh_pairs(connection, self.pulls)
+                text_features.store(connection, [text_features.features(pull_id, pull["body"])
+                                                 for pull_id, pull in self.pulls.items()])
+                cache.bump(connection, [pull["repository_id"] for pull in self.pulls.values()])
+            _upsert(CrawlState.__table__, list(self.crawl_states.values()), "url")
+            if len(self.crawl_states) > 0:
+                # PRs downloaded successfully, e.g. by a replay, are no longer failed
+                dead_letter = DeadLetter.__table__
+                connection.execute(dead_letter.delete().where(dead_letter.c.url.in_(list(self.crawl_states))))
+            _upsert(DeadLetter.__table__, list(self.dead_letters.values()), "url")
+
+
+class WriteBehindBuffer:
+    def __init__(self, max_size: int = 200, max_delay: float = 10):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.batch = Batch()
+        self.last_flush = time.monotonic()
+
+    @property
+    def due(self) -> bool:
+        return len(self.batch) >= self.max_size or \
+            (len(self.batch) > 0 and time.monotonic() - self.last_flush >= self.max_delay)
+
+    def take(self) -> Batch:
+        batch, self.batch = self.batch, Batch()
+        self.last_flush = time.monotonic()
+        return batch
+
+    def _add_user(self, user: Optional[dict]) -> Optional[int]:
+        if user is None:
+            return None
+        self.batch.users[user["id"]] = {"id": user["id"], "login": user["login"]}
+        return user["id"]
+
+    def add_repository(self, repo: dict) -> None:
+        self.batch.repositories[repo["id"]] = {
+            "id": repo["id"],
+            "name": repo["name"],
+            "full_name": repo["full_name"],
+            "owner_id": self._add_user(repo["owner"])
+        }
+
+    def add_pull(self, pull: dict, review_pages: List[list], commit_shas: List[str]) -> None:
+        pull_id = pull["id"]
+        self.batch.pulls[pull_id] = {
+            "id": pull_id,
+            "number": pull["number"],
+            "title": pull["title"],
+            "user_id": self._add_user(pull["user"]),
+            "body": pull["body"],
+            "created_at": _timestamp(pull["created_at"]),
+            "closed_at": _timestamp(pull["closed_at"]),
+            "assignee_id": self._add_user(pull["assignee"]),
+            "repository_id": pull["base"]["repo"]["id"],
+            "author_association": AuthorAssociationEnum[pull["author_association"]],
+            "merged": pull["merged"],
+            "additions": pull["additions"],
+            "deletions": pull["deletions"]
+        }
+        for assignee in pull["assignees"]:
+            self.batch.pulls_assignees.add((pull_id, self._add_user(assignee)))
+        for sha in commit_shas:
+            self.batch.pulls_commits.add((pull_id, sha))
+        for page in review_pages:
+            for review in page:
+                self.batch.reviews[review["id"]] = {
+                    "id": review["id"],
+                    "pull_id": pull_id,
+                    "user_id": self._add_user(review["user"]),
+                    "body": review["body"],
+                    "state": ReviewStatusesEnum[review["state"]],
+                    "author_association": AuthorAssociationEnum[review["author_association"]],
+                    "submitted_at": _timestamp(review["submitted_at"])
+                }
+
+    def add_crawl_state(self, project: str, url: str, etag: Optional[str] = None,
+                        last_modified: Optional[str] = None) -> None:
+        self.batch.crawl_states[url] = {
+            "url": url,
+            "project": project,
+            "etag": etag,
+            "last_modified": last_modified,
+            "completed_at": datetime.now()
+        }
+
+    def add_dead_letter(self, project: str, url: str, attempts: int, status: Optional[int], error: str) -> None:
+        self.batch.dead_letters[url] = {
+            "url": url,
+            "project": project,
+            "attempts": attempts,
+            "status": status,
+            "error": error,
+            "failed_at": datetime.now()
+        }
+
+
+class Writer:
+    # batches are written by a dedicated thread with its own connection, the event loop never waits for the database
+    def __init__(self, on_flushed: Callable[[Batch, float, Optional[Exception]], None], max_pending: int = 2):
+        self.on_flushed = on_flushed
+        self.batches: queue.SimpleQueue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="database-writer", daemon=True)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.room: Optional[asyncio.Semaphore] = None
+        self.max_pending = max_pending
+        self.pending = 0
+
+    def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.room = asyncio.Semaphore(self.max_pending)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            error = None
+            try:
+                batch.flush()
+            except Exception as e:
+                error = e
+            # results are reported on the event loop, telemetry is not shared between threads
+            self.loop.call_soon_threadsafe(self._flushed, batch, time.perf_counter() - started, error)
+
+    def _flushed(self, batch: Batch, seconds: float, error: Optional[Exception]) -> None:
+        self.pending -= 1
+        self.room.release()
+        self.on_flushed(batch, seconds, error)
+
+    async def submit(self, batch: Batch) -> None:
+        # waits while max_pending batches are not written yet, so the download slows down to the speed of the database
+        await self.room.acquire()
+        self.pending += 1
+        self.batches.put(batch)
+
+    async def close(self) -> None:
+        self.batches.put(None)
+        await self.loop.run_in_executor(None, self.thread.join)
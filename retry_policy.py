@@ -0,0 +1,70 @@
+import asyncio
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional
+
+import aiohttp
+
+
+class RetryError(Exception):
+    def __init__(self, attempts: int, error: Exception):
+        super().__init__(f"Gave up after {attempts} attempts: {repr(error)}")
+        self.attempts = attempts
+        self.error = error
+
+    @property
+    def status(self) -> Optional[int]:
+        return self.error.status if isinstance(self.error, aiohttp.ClientResponseError) else None
+
+
+class RetryPolicy:
+    # client errors which won't change by asking again
+    permanent_statuses = {400, 401, 404, 410, 422, 451}
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1, max_delay: float = 60,
+                 secondary_limit_delay: float = 60):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.secondary_limit_delay = secondary_limit_delay
+
+    def is_permanent(self, error: Exception) -> bool:
+        return isinstance(error, aiohttp.ClientResponseError) and error.status in self.permanent_statuses
+
+    def _retry_after(self, value: str) -> float:
+        # either seconds or an http date
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return self.secondary_limit_delay
+        # http dates are in GMT
+        date = date if date.tzinfo is not None else date.replace(tzinfo=timezone.utc)
+        return max((date - datetime.now(timezone.utc)).total_seconds(), 0)
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        if isinstance(error, aiohttp.ClientResponseError) and error.status in (403, 429):
+            # secondary rate limit, github asks to wait for Retry-After or at least a minute
+            retry_after = error.headers.get("Retry-After") if error.headers is not None else None
+            return self._retry_after(retry_after) if retry_after is not None else self.secondary_limit_delay
+        # exponential backoff with full jitter, concurrent workers don't retry in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    async def run(self, function: Callable[[], Awaitable],
+                  on_retry: Optional[Callable[[int, Exception, float], None]] = None):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await function()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if self.is_permanent(e) or attempt >= self.max_attempts:
+                    raise RetryError(attempt, e) from e
+                delay = self.delay(attempt, e)
+                if on_retry is not None:
+                    on_retry(attempt, e, delay)
+                await asyncio.sleep(delay)
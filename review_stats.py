@@ -0,0 +1,84 @@
+from typing import Iterable, Optional
+
+from sqlalchemy import select, func, case, tuple_
+from sqlalchemy.sql import Select
+
+import functions
+from definitions import Review, PullRequest, PullReviewStats, ReviewerPair
+
+
+def aggregate(pull_ids: Optional[Iterable[int]] = None) -> Select:
+    per_reviewer = select(Review.pull_id, func.count(Review.id).label("reviews")) \
+        .group_by(Review.pull_id, Review.user_id)
+    stats = select(Review.pull_id,
+                   func.count(Review.id).label("review_count"),
+                   func.count(Review.user_id.distinct()).label("reviewer_count"),
+                   func.count(case((Review.user_id != PullRequest.user_id, Review.user_id)).distinct())
+                   .label("other_reviewer_count"),
+                   func.sum(functions.char_length(Review.body)).label("body_chars"),
+                   func.min(Review.submitted_at).label("first_review_at"),
+                   func.max(Review.submitted_at).label("last_review_at")) \
+        .join(PullRequest, PullRequest.id == Review.pull_id) \
+        .group_by(Review.pull_id)
+    if pull_ids is not None:
+        per_reviewer = per_reviewer.where(Review.pull_id.in_(list(pull_ids)))
+        stats = stats.where(Review.pull_id.in_(list(pull_ids)))
+    per_reviewer = per_reviewer.subquery()
+    rounds = select(per_reviewer.c.pull_id, func.max(per_reviewer.c.reviews).label("max_reviews_per_reviewer")) \
+        .group_by(per_reviewer.c.pull_id) \
+        .subquery()
+    stats = stats.subquery()
+    return select(stats.c.pull_id,
+                  stats.c.review_count,
+                  stats.c.reviewer_count,
+                  stats.c.other_reviewer_count,
+                  stats.c.body_chars,
+                  rounds.c.max_reviews_per_reviewer,
+                  stats.c.first_review_at,
+                  stats.c.last_review_at) \
+        .join(rounds, rounds.c.pull_id == stats.c.pull_id)
+
+
+def refresh(connection, pull_ids: Optional[Iterable[int]] = None) -> None:
+    table = PullReviewStats.__table__
+    delete = table.delete()
+    if pull_ids is not None:
+        pull_ids = list(pull_ids)
+        delete = delete.where(table.c.pull_id.in_(pull_ids))
+    connection.execute(delete)
+    rows = aggregate(pull_ids)
+    connection.execute(table.insert().from_select(list(rows.selected_columns.keys()), rows))
+
+
+def pairs(requesters: Optional[Select] = None) -> Select:
+    counts = select(PullRequest.repository_id,
+                    PullRequest.user_id.label("requester_id"),
+                    Review.user_id.label("reviewer_id"),
+                    func.count(Review.id).label("reviews")) \
+        .join(Review, Review.pull_id == PullRequest.id) \
+        .where(Review.user_id != PullRequest.user_id) \
+        .group_by(PullRequest.repository_id, PullRequest.user_id, Review.user_id)
+    if requesters is not None:
+        counts = counts.where(tuple_(PullRequest.repository_id, PullRequest.user_id).in_(requesters))
+    counts = counts.subquery()
+    return select(counts.c.repository_id,
+                  counts.c.requester_id,
+                  counts.c.reviewer_id,
+                  counts.c.reviews,
+                  func.sum(counts.c.reviews).over(partition_by=(counts.c.repository_id, counts.c.requester_id))
+                  .label("requester_reviews"))
+
+
+def refresh_pairs(connection, pull_ids: Optional[Iterable[int]] = None) -> None:
+    # shares of a requester depend on all of their reviews, so every pair of the authors of given PRs is recomputed
+    table = ReviewerPair.__table__
+    delete = table.delete()
+    requesters = None
+    if pull_ids is not None:
+        requesters = select(PullRequest.repository_id, PullRequest.user_id) \
+            .where(PullRequest.id.in_(list(pull_ids))) \
+            .distinct()
+        delete = delete.where(tuple_(table.c.repository_id, table.c.requester_id).in_(requesters))
+    connection.execute(delete)
+    rows = pairs(requesters)
+    connection.execute(table.insert().from_select(list(rows.selected_columns.keys()), rows))
@@ -1,10 +1,32 @@
-from typing import List, Callable
+from typing import List, Callable, Dict, Tuple, Optional
 
-from sqlalchemy import func, or_, and_, not_, tuple_, sql
+import numpy as np
+from sqlalchemy import or_, and_, not_, exists, case, select
 from sqlalchemy.orm import Query
+from sqlalchemy.sql import ColumnElement
 
-import sql as sql_scripts
-from definitions import Repository, PullRequest, Review
+import functions
+import text_features
+from definitions import Repository, PullRequest, Review, PullReviewStats, ReviewerPair, PullTextFeatures
+
+
+class Thresholds:
+    def __init__(self, buddy_share: float = 0.5, buddy_min_reviews: int = 50, ping_pong_rounds: int = 3):
+        self.buddy_share = buddy_share
+        self.buddy_min_reviews = buddy_min_reviews
+        self.ping_pong_rounds = ping_pong_rounds
+
+    def __repr__(self) -> str:
+        # part of cache keys and incremental watermarks, see evaluator.settings
+        return f"Thresholds({self.buddy_share}, {self.buddy_min_reviews}, {self.ping_pong_rounds})"
+
+
+thresholds = Thresholds()
+
+
+def configure(buddy_share: float = 0.5, buddy_min_reviews: int = 50, ping_pong_rounds: int = 3) -> None:
+    global thresholds
+    thresholds = Thresholds(buddy_share, buddy_min_reviews, ping_pong_rounds)
 
 
 class Result:
@@ -13,14 +35,66 @@ class Result:
         self.repo = repo
         self.considered = considered
         self.smelly = smelly
+        self.arrays: Optional[Dict[str, np.ndarray]] = None
+
+    def _loaded(self) -> Dict[str, np.ndarray]:
+        # queries run once, counts, percentage and set operations use sorted arrays of PR ids afterwards
+        if self.arrays is None:
+            self.load(self.materialize())
+        return self.arrays
+
+    @property
+    def considered_ids(self) -> np.ndarray:
+        return self._loaded()["considered"]
+
+    @property
+    def smelly_ids(self) -> np.ndarray:
+        return self._loaded()["smelly"]
 
     @property
     def considered_count(self) -> int:
-        return self.considered.count()
+        return len(self.considered_ids)
 
     @property
     def smelly_count(self) -> int:
-        return self.smelly.count()
+        return len(self.smelly_ids)
+
+    def materialize(self) -> Dict[str, np.ndarray]:
+        def _ids(query: Query) -> np.ndarray:
+            return np.sort(np.array([pull_id for pull_id, in query.with_entities(PullRequest.id)], dtype=np.int64))
+
+        return {"considered": _ids(self.considered), "smelly": _ids(self.smelly)}
+
+    def load(self, arrays: Dict[str, np.ndarray]) -> None:
+        self.arrays = arrays
+        # PRs are read by id instead of evaluating the smell again
+        self.smelly = self.considered.filter(PullRequest.id.in_(arrays["smelly"].tolist()))
+
+    def contains(self, pull_ids: np.ndarray) -> np.ndarray:
+        # binary search in the sorted ids of smelly PRs
+        smelly = self.smelly_ids
+        if len(smelly) == 0:
+            return np.zeros(len(pull_ids), dtype=bool)
+        return smelly[np.minimum(np.searchsorted(smelly, pull_ids), len(smelly) - 1)] == pull_ids
+
+    def __contains__(self, pull_id: int) -> bool:
+        return bool(self.contains(np.array([pull_id], dtype=np.int64))[0])
+
+    def _combine(self, other: "Result", title: str, operation: Callable) -> "Result":
+        # e.g. results of other repositories, data versions or cache entries
+        if not np.array_equal(self.considered_ids, other.considered_ids):
+            raise ValueError("Results evaluated over different PRs cannot be combined")
+        result = Result(_combined_name(title, [self.evaluator_name, other.evaluator_name]), self.repo,
+                        self.considered, None)
+        result.load({"considered": self.considered_ids,
+                     "smelly": operation(self.smelly_ids, other.smelly_ids)})
+        return result
+
+    def union(self, other: "Result") -> "Result":
+        return self._combine(other, "At least one of:", np.union1d)
+
+    def intersection(self, other: "Result") -> "Result":
+        return self._combine(other, "All of:", lambda a, b: np.intersect1d(a, b, assume_unique=True))
 
     @property
     def percentage(self) -> float:
@@ -30,87 +104,192 @@ class Result:
         return f"{self.evaluator_name.ljust(30)}\t{(self.percentage * 100):.2f}%"
 
 
-def lack_of_review(considered: Query, repo: Repository) -> Result:
-    # noinspection PyUnresolvedReferences
-    smelly = considered.except_(considered.join(PullRequest.reviews).filter(PullRequest.user_id != Review.user_id))
-    return Result("Lack of code review", repo, considered, smelly)
+class Flags:
+    def __init__(self, repo: Repository, considered: Query, evaluators: List[Callable], rows: List[Tuple]):
+        self.repo = repo
+        self.considered = considered
+        self.evaluators = evaluators
+        # sorted like ids of results, see Result.materialize
+        rows = sorted(rows, key=lambda row: row[0])
+        self.pull_ids = [row[0] for row in rows]
+        self.columns = {evaluator: [bool(row[i + 1]) for row in rows] for i, evaluator in enumerate(evaluators)}
 
+    def _ids(self, flags: List[bool]) -> List[int]:
+        return [pull_id for pull_id, flag in zip(self.pull_ids, flags) if flag]
 
-# noinspection PyNoneFunctionAssignment
-def missing_description(considered: Query, repo: Repository) -> Result:
-    smelly = considered.filter(
-        or_(
-            PullRequest.title == "",
-            PullRequest.body == "",
-            and_(
-                PullRequest.body.notlike("%\n%"),
-                not_(
-                    or_(
-                        PullRequest.body.ilike("%fixes%"),
-                        PullRequest.body.ilike("%ticket%"),
-                        PullRequest.body.regexp_match("#[0-9]+")
-                    )
+    def smelly_ids(self, evaluator: Callable) -> List[int]:
+        return self._ids(self.columns[evaluator])
+
+    def union_ids(self, evaluators: List[Callable]) -> List[int]:
+        return self._ids([any(flags) for flags in zip(*[self.columns[e] for e in evaluators])])
+
+    def intersection_ids(self, evaluators: List[Callable]) -> List[int]:
+        return self._ids([all(flags) for flags in zip(*[self.columns[e] for e in evaluators])])
+
+    def _result(self, evaluator_name: str, smelly_ids: List[int]) -> Result:
+        # loaded from the flags, results are not queried again
+        result = Result(evaluator_name, self.repo, self.considered, None)
+        result.load({"considered": np.array(self.pull_ids, dtype=np.int64),
+                     "smelly": np.array(smelly_ids, dtype=np.int64)})
+        return result
+
+    def result(self, evaluator: Callable) -> Result:
+        return self._result(_smells[evaluator][0], self.smelly_ids(evaluator))
+
+    def results(self) -> List[Result]:
+        return [self.result(evaluator) for evaluator in self.evaluators]
+
+    def union(self, evaluators: List[Callable]) -> Result:
+        return self._result(_combined_name("At least one of:", [e.__name__ for e in evaluators]),
+                            self.union_ids(evaluators))
+
+    def intersection(self, evaluators: List[Callable]) -> Result:
+        return self._result(_combined_name("All of:", [e.__name__ for e in evaluators]),
+                            self.intersection_ids(evaluators))
+
+
+def _lack_of_review(repo: Repository) -> ColumnElement:
+    return not_(exists().where(and_(Review.pull_id == PullRequest.id, PullRequest.user_id != Review.user_id)))
+
+
+def _scan_description() -> ColumnElement:
+    return or_(
+        PullRequest.body == "",
+        and_(
+            PullRequest.body.notlike("%\n%"),
+            not_(
+                or_(
+                    PullRequest.body.ilike("%fixes%"),
+                    PullRequest.body.ilike("%ticket%"),
+                    PullRequest.body.regexp_match("#[0-9]+")
                 )
             )
         )
     )
+
+
+def _missing_description(repo: Repository) -> ColumnElement:
+    # text features are computed when PRs are stored, bodies are scanned only for PRs missing them
+    undescribed = exists().where(and_(
+        PullTextFeatures.pull_id == PullRequest.id,
+        or_(PullTextFeatures.body_length == 0,
+            and_(PullTextFeatures.line_count == 1,
+                 text_features.matches_none(["fixes", "ticket", "issue_reference"])))))
+    not_computed = not_(exists().where(PullTextFeatures.pull_id == PullRequest.id))
+    return or_(PullRequest.title == "", undescribed, and_(not_computed, _scan_description()))
+
+
+def _large_changesets(repo: Repository) -> ColumnElement:
+    return PullRequest.deletions + PullRequest.additions > 500
+
+
+def _sleeping_reviews(repo: Repository) -> ColumnElement:
+    return functions.seconds_between(PullRequest.created_at, PullRequest.closed_at) >= 2 * 24 * 60 * 60
+
+
+def _review_buddies(repo: Repository) -> ColumnElement:
+    # reviewer pairs are maintained by review_stats.refresh_pairs, buddies are a filter over them
+    buddies = select(ReviewerPair.requester_id, ReviewerPair.reviewer_id) \
+        .where(ReviewerPair.repository_id == repo.id,
+               ReviewerPair.requester_reviews > thresholds.buddy_min_reviews,
+               ReviewerPair.reviews > ReviewerPair.requester_reviews * thresholds.buddy_share) \
+        .subquery()
+    return exists().where(and_(Review.pull_id == PullRequest.id,
+                               Review.user_id == buddies.c.reviewer_id,
+                               PullRequest.user_id == buddies.c.requester_id))
+
+
+def _ping_pong(repo: Repository) -> ColumnElement:
+    return exists().where(and_(PullReviewStats.pull_id == PullRequest.id,
+                               PullReviewStats.max_reviews_per_reviewer > thresholds.ping_pong_rounds))
+
+
+def _evaluate(evaluator: Callable, considered: Query, repo: Repository) -> Result:
+    name, condition = _smells[evaluator]
     # noinspection PyTypeChecker
-    return Result("Missing PR description", repo, considered, smelly)
+    return Result(name, repo, considered, considered.filter(condition(repo)))
+
+
+def lack_of_review(considered: Query, repo: Repository) -> Result:
+    return _evaluate(lack_of_review, considered, repo)
+
+
+def missing_description(considered: Query, repo: Repository) -> Result:
+    return _evaluate(missing_description, considered, repo)
 
 
-# noinspection PyNoneFunctionAssignment
 def large_changesets(considered: Query, repo: Repository) -> Result:
-    smelly = considered.filter(PullRequest.deletions + PullRequest.additions > 500)
-    # noinspection PyTypeChecker
-    return Result("Large changeset", repo, considered, smelly)
+    return _evaluate(large_changesets, considered, repo)
 
 
-# noinspection PyNoneFunctionAssignment
 def sleeping_reviews(considered: Query, repo: Repository) -> Result:
-    smelly = considered.filter((PullRequest.closed_at - PullRequest.created_at) >= func.make_interval(0, 0, 0, 2))
-    # noinspection PyTypeChecker
-    return Result("Sleeping reviews", repo, considered, smelly)
+    return _evaluate(sleeping_reviews, considered, repo)
 
 
 def review_buddies(considered: Query, repo: Repository) -> Result:
-    session = considered.session
-    smelly_id_pairs = session.execute(sql_scripts.REVIEW_BUDDIES, {"repo_id": repo.id})
+    return _evaluate(review_buddies, considered, repo)
 
-    # noinspection PyUnresolvedReferences
-    smelly = considered.join(Review).where(
-        tuple_(PullRequest.user_id, Review.user_id).in_(smelly_id_pairs)
-    )
 
-    return Result("Review Buddies", repo, considered, smelly)
+def ping_pong(considered: Query, repo: Repository) -> Result:
+    return _evaluate(ping_pong, considered, repo)
+
 
+_smells: Dict[Callable, Tuple[str, Callable[[Repository], ColumnElement]]] = {
+    lack_of_review: ("Lack of code review", _lack_of_review),
+    missing_description: ("Missing PR description", _missing_description),
+    large_changesets: ("Large changeset", _large_changesets),
+    sleeping_reviews: ("Sleeping reviews", _sleeping_reviews),
+    review_buddies: ("Review Buddies", _review_buddies),
+    ping_pong: ("Ping-pong reviews", _ping_pong)
+}
 
-def ping_pong(considered: Query, repo: Repository) -> Result:
-    session = considered.session
-    smelly_id_pairs = map(lambda row: row[0], session.execute(sql_scripts.PING_PONG, {"repo_id": repo.id}))
 
-    smelly = considered.filter(PullRequest.id.in_(smelly_id_pairs))
+# smells of a PR depending on other PRs of the repository, they change with every PR of the same author
+_repository_wide = {review_buddies}
 
-    # noinspection PyTypeChecker
-    return Result("Ping-pong reviews", repo, considered, smelly)
+
+def evaluators() -> List[Callable]:
+    return list(_smells)
+
+
+def name(evaluator: Callable) -> str:
+    return _smells[evaluator][0]
+
+
+def expression(evaluator: Callable, repo: Repository) -> ColumnElement:
+    # condition on a PR of the considered query, true when the PR has the smell
+    return _smells[evaluator][1](repo)
+
+
+def is_repository_wide(evaluator: Callable) -> bool:
+    return evaluator in _repository_wide
+
+
+def _combined_name(title: str, names: List[str]) -> str:
+    name = title
+    for n in names:
+        name += f"\n- {n.strip().ljust(28)}"
+    return name
 
 
 def union(considered: Query, repo: Repository, evaluators: List[Callable]) -> Result:
-    session = considered.session
-    smelly = session.query(PullRequest).filter(sql.false())
-    for evaluator in evaluators:
-        smelly = smelly.union(evaluator(considered, repo).smelly)
-    name = "At least one of:"
-    for e in evaluators:
-        name += f"\n- {e.__name__.ljust(28)}"
-    return Result(name, repo, considered, smelly)
+    smelly = considered.filter(or_(*[_smells[evaluator][1](repo) for evaluator in evaluators]))
+    # noinspection PyTypeChecker
+    return Result(_combined_name("At least one of:", [e.__name__ for e in evaluators]), repo, considered, smelly)
 
 
 def intersection(considered: Query, repo: Repository, evaluators: List[Callable]) -> Result:
-    session = considered.session
-    smelly = session.query(PullRequest)
-    for evaluator in evaluators:
-        smelly = smelly.intersect(evaluator(considered, repo).smelly)
-    name = "All of:"
-    for e in evaluators:
-        name += f"\n- {e.__name__.ljust(28)}"
-    return Result(name, repo, considered, smelly)
+    smelly = considered.filter(and_(*[_smells[evaluator][1](repo) for evaluator in evaluators]))
+    # noinspection PyTypeChecker
+    return Result(_combined_name("All of:", [e.__name__ for e in evaluators]), repo, considered, smelly)
+
+
+def flags_query(considered: Query, repo: Repository, evaluators: List[Callable]) -> Query:
+    return considered.with_entities(
+        PullRequest.id,
+        *[case((_smells[evaluator][1](repo), True), else_=False).label(evaluator.__name__) for evaluator in evaluators]
+    )
+
+
+def evaluate_all(considered: Query, repo: Repository, evaluators: List[Callable]) -> Flags:
+    return Flags(repo, considered, evaluators, flags_query(considered, repo, evaluators).all())
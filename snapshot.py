@@ -0,0 +1,62 @@
+import argparse
+import time
+from typing import List, Optional, Tuple
+
+from sqlalchemy import create_engine, select, Table
+from sqlalchemy.sql import Select
+
+import db
+from configuration import ProjectConfiguration
+from definitions import User, Repository, Commit, PullRequest, Review, PullReviewStats, ReviewerPair, \
+    PullTextFeatures, DataVersion, pulls_commits_table, pulls_assignees_table
+
+
+def _selections(projects: Optional[List[str]]) -> List[Tuple[Table, Select]]:
+    def _rows(table: Table, condition=None) -> Tuple[Table, Select]:
+        rows = select(table)
+        return table, rows if condition is None or projects is None else rows.where(condition)
+
+    repositories = select(Repository.id).where(Repository.full_name.in_(projects or []))
+    pulls = select(PullRequest.id).where(PullRequest.repository_id.in_(repositories))
+    return [
+        _rows(User.__table__),
+        _rows(Repository.__table__, Repository.id.in_(repositories)),
+        _rows(DataVersion.__table__, DataVersion.repository_id.in_(repositories)),
+        _rows(Commit.__table__, Commit.project.in_(projects or [])),
+        _rows(PullRequest.__table__, PullRequest.repository_id.in_(repositories)),
+        _rows(Review.__table__, Review.pull_id.in_(pulls)),
+        _rows(pulls_commits_table, pulls_commits_table.c.pull_id.in_(pulls)),
+        _rows(pulls_assignees_table, pulls_assignees_table.c.pull_id.in_(pulls)),
+        _rows(PullReviewStats.__table__, PullReviewStats.pull_id.in_(pulls)),
+        _rows(ReviewerPair.__table__, ReviewerPair.repository_id.in_(repositories)),
+        _rows(PullTextFeatures.__table__, PullTextFeatures.pull_id.in_(pulls))
+    ]
+
+
+def copy(source_connection_string: str, target_path: str, projects: Optional[List[str]] = None,
+         batch_size: int = 10000) -> None:
+    # analysis of the copy runs in process, without a database server
+    started = time.time()
+    source = create_engine(source_connection_string)
+    db.prepare(f"sqlite:///{target_path}")
+    with source.connect() as reading, db.engine.begin() as writing:
+        for table, rows in _selections(projects):
+            writing.execute(table.delete())
+            copied = 0
+            for partition in reading.execution_options(stream_results=True).execute(rows).partitions(batch_size):
+                writing.execute(table.insert(), [dict(row._mapping) for row in partition])
+                copied += len(partition)
+            print(f"{table.name.ljust(20)}\t{copied} rows")
+    print(f"Snapshot written to {target_path} in {time.time() - started:.1f}s, "
+          f"analyse it with connstr=sqlite:///{target_path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Copies the database into a SQLite file for analysis without a server")
+    parser.add_argument("--output", default="snapshot.db")
+    parser.add_argument("--project", action="store_true",
+                        help="copy only projects listed in config.properties")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+    config = ProjectConfiguration()
+    copy(config.connstr, args.output, config.projects if args.project else None, args.batch_size)
@@ -0,0 +1,181 @@
+import bisect
+import json
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Histogram:
+    def __init__(self, buckets: Optional[List[float]] = None):
+        self.buckets = buckets or _buckets
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        # upper bound of the bucket holding the quantile, precise enough for a status line
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+
+class Telemetry:
+    def __init__(self, namespace: str = "downloader"):
+        self.namespace = namespace
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.sinks = []
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, _labels(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, **labels) -> None:
+        self.gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, _labels(labels))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(value)
+
+    def total(self, name: str) -> float:
+        return sum(value for (counter, _), value in self.counters.items() if counter == name)
+
+    def merged(self, name: str) -> Histogram:
+        merged = Histogram()
+        for (histogram_name, _), histogram in self.histograms.items():
+            if histogram_name == name:
+                merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                merged.sum += histogram.sum
+                merged.count += histogram.count
+        return merged
+
+    def event(self, name: str, **fields) -> None:
+        self.count("events_total", event=name)
+        for sink in self.sinks:
+            sink.event(self, name, fields)
+
+    def flush(self) -> None:
+        for sink in self.sinks:
+            sink.write(self)
+
+
+class JsonLinesSink:
+    def __init__(self, path: str):
+        self.path = path
+
+    def _append(self, record: dict) -> None:
+        with open(self.path, "a") as file:
+            file.write(json.dumps(record, default=str) + "\n")
+
+    def event(self, telemetry: Telemetry, name: str, fields: dict) -> None:
+        self._append({"time": datetime.now().isoformat(), "event": name, **fields})
+
+    def write(self, telemetry: Telemetry) -> None:
+        def _entries(metrics: dict, value) -> List[dict]:
+            return [{"name": name, "labels": dict(labels), **value(metric)}
+                    for (name, labels), metric in metrics.items()]
+
+        self._append({
+            "time": datetime.now().isoformat(),
+            "event": "metrics",
+            "counters": _entries(telemetry.counters, lambda v: {"value": v}),
+            "gauges": _entries(telemetry.gauges, lambda v: {"value": v}),
+            "histograms": _entries(telemetry.histograms, lambda h: {"count": h.count, "sum": h.sum,
+                                                                    "p50": h.quantile(0.5), "p95": h.quantile(0.95)})
+        })
+
+
+class PrometheusSink:
+    def __init__(self, path: str):
+        self.path = path
+
+    def event(self, telemetry: Telemetry, name: str, fields: dict) -> None:
+        pass
+
+    def write(self, telemetry: Telemetry) -> None:
+        def _format(labels: Labels) -> str:
+            return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}" if labels else ""
+
+        lines = []
+        for kind, metrics in (("counter", telemetry.counters), ("gauge", telemetry.gauges)):
+            for name in sorted({name for name, _ in metrics}):
+                lines.append(f"# TYPE {telemetry.namespace}_{name} {kind}")
+                lines += [f"{telemetry.namespace}_{name}{_format(labels)} {value}"
+                          for (metric, labels), value in metrics.items() if metric == name]
+        for name in sorted({name for name, _ in telemetry.histograms}):
+            lines.append(f"# TYPE {telemetry.namespace}_{name} histogram")
+            for (metric, labels), histogram in telemetry.histograms.items():
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{telemetry.namespace}_{name}_bucket{_format(labels + (('le', str(bound)),))} "
+                                 f"{cumulative}")
+                lines.append(f"{telemetry.namespace}_{name}_sum{_format(labels)} {histogram.sum}")
+                lines.append(f"{telemetry.namespace}_{name}_count{_format(labels)} {histogram.count}")
+        # written at once, so scrapers never read a half written file
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temporary, self.path)
+
+
+class Throughput:
+    def __init__(self, window: float = 60):
+        self.window = window
+        self.samples = deque()
+
+    def update(self, done: float) -> Optional[float]:
+        now = time.monotonic()
+        self.samples.append((now, done))
+        while len(self.samples) > 2 and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+        elapsed = now - self.samples[0][0]
+        return (done - self.samples[0][1]) / elapsed if elapsed > 0 else None
+
+
+class StatusLine:
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self.text = ""
+
+    def update(self, text: str) -> None:
+        # carriage return instead of clearing the terminal, the line is redrawn in place
+        self.stream.write("\r" + text.ljust(len(self.text)))
+        self.stream.flush()
+        self.text = text
+
+    def message(self, text: str) -> None:
+        self.stream.write("\r" + text.ljust(len(self.text)) + "\n" + self.text)
+        self.stream.flush()
+
+    def close(self) -> None:
+        self.stream.write("\n")
+        self.stream.flush()
+        self.text = ""
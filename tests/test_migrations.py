@@ -0,0 +1,48 @@
+import sqlite3
+from datetime import datetime
+
+from sqlalchemy import inspect, select, func
+
+import db
+import migrations
+from definitions import SchemaVersion, PullRequest, pulls_commits_table
+
+# schema of databases created before versioned migrations, link tables without primary keys
+_baseline = """
+CREATE TABLE "commit" (id VARCHAR PRIMARY KEY, buggy BOOLEAN, project VARCHAR, la INTEGER, ld INTEGER, nf INTEGER,
+                       nd INTEGER, ns INTEGER, ent FLOAT, ndev FLOAT, age FLOAT, nuc FLOAT, aexp INTEGER,
+                       arexp FLOAT, asexp FLOAT);
+CREATE TABLE user (id INTEGER PRIMARY KEY, login VARCHAR);
+CREATE TABLE repo (id INTEGER PRIMARY KEY, name VARCHAR, full_name VARCHAR, owner_id INTEGER REFERENCES user (id));
+CREATE TABLE pull (id INTEGER PRIMARY KEY, number INTEGER, title VARCHAR, user_id INTEGER REFERENCES user (id),
+                   body VARCHAR, created_at DATETIME, closed_at DATETIME, assignee_id INTEGER REFERENCES user (id),
+                   repository_id INTEGER REFERENCES repo (id), author_association VARCHAR(12), merged BOOLEAN,
+                   additions INTEGER, deletions INTEGER);
+CREATE TABLE review (id INTEGER PRIMARY KEY, pull_id INTEGER REFERENCES pull (id),
+                     user_id INTEGER REFERENCES user (id), body VARCHAR, state VARCHAR(17),
+                     author_association VARCHAR(12), submitted_at DATETIME);
+CREATE TABLE pulls_commits (commit_id VARCHAR REFERENCES "commit" (id), pull_id INTEGER REFERENCES pull (id));
+CREATE TABLE pulls_assignees (assignee_id INTEGER REFERENCES user (id), pull_id INTEGER REFERENCES pull (id));
+INSERT INTO user VALUES (1, 'author');
+INSERT INTO repo VALUES (1, 'project', 'apache/project', 1);
+INSERT INTO "commit" (id, buggy, project) VALUES ('a', 0, 'apache/project');
+INSERT INTO pull (id, number, title, user_id, body, created_at, closed_at, repository_id, merged, additions, deletions)
+VALUES (1, 1, 'title', 1, 'Fixes #1', '2020-01-01 00:00:00', '2020-01-02 00:00:00', 1, 1, 1, 0);
+INSERT INTO pulls_commits VALUES ('a', 1), ('a', 1);
+"""
+
+
+def test_upgrade_of_baseline_database(tmp_path):
+    path = tmp_path / "baseline.db"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(_baseline)
+    db.prepare(f"sqlite:///{path}")
+    with db.engine.connect() as connection:
+        assert connection.execute(select(func.max(SchemaVersion.version))).scalar() == len(migrations._migrations)
+        indexes = {index["name"] for table in ["pull", "pulls_commits"]
+                   for index in inspect(connection).get_indexes(table)}
+        assert {"ix_pull_considered", "ix_pull_repository_id_updated_at", "ix_pulls_commits_pull_id"} <= indexes
+        assert connection.execute(select(func.count()).select_from(PullRequest.__table__)
+                                  .where(PullRequest.updated_at <= datetime.now())).scalar() == 1
+        # duplicated links are removed before the primary key is added
+        assert connection.execute(select(func.count()).select_from(pulls_commits_table)).scalar() == 1
@@ -0,0 +1,23 @@
+import text_features
+
+
+def _matched(body: str) -> int:
+    return text_features.features(1, body)["patterns"]
+
+
+def test_overlapping_patterns_are_all_matched():
+    assert _matched("MYTICKET-3 done") == text_features.mask(["ticket", "jira_key"])
+    assert _matched("FIXES-12") == text_features.mask(["fixes", "jira_key"])
+    assert _matched("Fixes #12, see ticket") == text_features.mask(["fixes", "ticket", "issue_reference"])
+
+
+def test_patterns_match_like_the_body_scan():
+    # the scan of missing_description used ILIKE '%fixes%', ILIKE '%ticket%' and '#[0-9]+'
+    assert _matched("prefixes") == text_features.mask(["fixes"])
+    assert _matched("Tickets") == text_features.mask(["ticket"])
+    assert _matched("refactoring only") == 0
+
+
+def test_missing_body():
+    features = text_features.features(1, None)
+    assert features["patterns"] is None and features["version"] == text_features.version
@@ -0,0 +1,73 @@
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, or_
+from sqlalchemy.sql import ColumnElement
+
+import db
+from configuration import ProjectConfiguration
+from definitions import PullRequest, PullTextFeatures
+
+# append only, position in the list is the bit of the pattern in pull_text_features.patterns,
+# a new pattern is matched in existing PRs by backfill
+_patterns: List[Tuple[str, str]] = [
+    ("fixes", r"(?i:fixes)"),
+    ("ticket", r"(?i:ticket)"),
+    ("issue_reference", r"#[0-9]+"),
+    ("jira_key", r"\b[A-Z][A-Z0-9_]+-[0-9]+\b")
+]
+
+# every pattern is searched on its own, matches of different patterns may overlap, e.g. in "MYTICKET-3"
+_matchers = [(1 << bit, re.compile(pattern)) for bit, (_, pattern) in enumerate(_patterns)]
+
+# bumped when matching of existing patterns changes
+_revision = 1
+# features stored with an older version are computed again by backfill
+version = len(_patterns) + _revision
+
+
+def mask(names: Iterable[str]) -> int:
+    bits = {name: 1 << bit for bit, (name, _) in enumerate(_patterns)}
+    return sum(bits[name] for name in names)
+
+
+def features(pull_id: int, body: Optional[str]) -> dict:
+    if body is None:
+        return {"pull_id": pull_id, "body_length": None, "line_count": None, "patterns": None, "version": version}
+    patterns = sum(bit for bit, matcher in _matchers if matcher.search(body) is not None)
+    return {"pull_id": pull_id, "body_length": len(body), "line_count": body.count("\n") + 1, "patterns": patterns,
+            "version": version}
+
+
+def matches_none(names: Iterable[str]) -> ColumnElement:
+    return PullTextFeatures.patterns.op("&")(mask(names)) == 0
+
+
+def store(connection, rows: List[dict]) -> None:
+    if len(rows) > 0:
+        connection.execute(db.insert_on_conflict(PullTextFeatures.__table__, ["pull_id"],
+                                                 ["body_length", "line_count", "patterns", "version"]), rows)
+
+
+def backfill(connection, batch_size: int = 5000) -> int:
+    # PRs stored before the table existed, before the last pattern was added or before matching changed
+    outdated = select(PullRequest.id, PullRequest.body) \
+        .outerjoin(PullTextFeatures, PullTextFeatures.pull_id == PullRequest.id) \
+        .where(or_(PullTextFeatures.pull_id.is_(None), PullTextFeatures.version < version)) \
+        .order_by(PullRequest.id) \
+        .limit(batch_size)
+    last, filled = None, 0
+    while True:
+        batch = connection.execute(outdated if last is None else outdated.where(PullRequest.id > last)).all()
+        if len(batch) == 0:
+            return filled
+        store(connection, [features(pull_id, body) for pull_id, body in batch])
+        last = batch[-1][0]
+        filled += len(batch)
+
+
+if __name__ == '__main__':
+    config = ProjectConfiguration()
+    db.prepare(config.connstr)
+    with db.engine.begin() as main_connection:
+        print(f"Computed text features of {backfill(main_connection)} PRs")
@@ -0,0 +1,93 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Mapping, Optional
+
+
+class _TokenState:
+    def __init__(self, token: str, limit: int):
+        self.token = token
+        self.remaining = limit
+        self.reset = 0.0
+        self.in_flight = 0
+
+    @property
+    def budget(self) -> int:
+        return self.remaining - self.in_flight
+
+
+class TokenPool:
+    def __init__(self, tokens: List[str], limit: int = 5000, margin: float = 5, poll: float = 0.1,
+                 announce: Callable[[str], None] = print):
+        self.tokens = tokens
+        self.limit = limit
+        self.margin = margin
+        self.poll = poll
+        # e.g. StatusLine.message, so the message does not break the status line
+        self.announce = announce
+        # github keeps a separate budget of every token per resource, e.g. core for rest and graphql
+        self._states: Dict[str, Dict[str, _TokenState]] = {}
+
+    def _resource(self, resource: str) -> Dict[str, _TokenState]:
+        if resource not in self._states:
+            self._states[resource] = {token: _TokenState(token, self.limit) for token in self.tokens}
+        return self._states[resource]
+
+    def _take(self, resource: str) -> Optional[str]:
+        now = time.time()
+        states = self._resource(resource)
+        for state in states.values():
+            if state.reset <= now:
+                # rate limit window has passed, assume full budget until github tells otherwise
+                state.remaining = self.limit
+        state = max(states.values(), key=lambda s: s.budget)
+        if state.budget <= 0:
+            return None
+        state.in_flight += 1
+        return state.token
+
+    def _in_flight(self, resource: str) -> bool:
+        # budget held by requests in flight is returned when their responses arrive, well before the window resets
+        return any(s.in_flight > 0 and s.remaining > 0 for s in self._resource(resource).values())
+
+    def _waiting_time(self, resource: str) -> float:
+        return max(min(s.reset for s in self._resource(resource).values()) - time.time(), 0) + self.margin
+
+    def _announce(self, waiting: float) -> None:
+        self.announce(f"[{datetime.now()}] Exceeded number of requests on all tokens, "
+                      f"waiting {int(waiting // 60)}m{int(waiting % 60)}s")
+
+    async def acquire(self, resource: str = "core") -> str:
+        token = self._take(resource)
+        while token is None:
+            if self._in_flight(resource):
+                await asyncio.sleep(self.poll)
+            else:
+                waiting = self._waiting_time(resource)
+                self._announce(waiting)
+                await asyncio.sleep(waiting)
+            token = self._take(resource)
+        return token
+
+    def update(self, token: str, headers: Optional[Mapping[str, str]] = None, resource: str = "core") -> None:
+        state = self._resource(resource)[token]
+        state.in_flight = max(state.in_flight - 1, 0)
+        if headers is None or "x-ratelimit-remaining" not in headers:
+            return
+        # rate limit headers describe the budget github charged, which it names in x-ratelimit-resource
+        state = self._resource(headers.get("x-ratelimit-resource", resource))[token]
+        remaining = int(headers["x-ratelimit-remaining"])
+        reset = float(headers.get("x-ratelimit-reset", state.reset))
+        if reset != state.reset:
+            state.reset = reset
+            state.remaining = remaining
+        else:
+            # responses can arrive out of order, the lowest value is the most recent one
+            state.remaining = min(state.remaining, remaining)
+
+    def remaining(self, resource: str = "core") -> Dict[str, int]:
+        return {token: state.remaining for token, state in self._resource(resource).items()}
+
+    @staticmethod
+    def is_exhausted(status: int, headers: Mapping[str, str]) -> bool:
+        return status in (403, 429) and headers.get("x-ratelimit-remaining") == "0"